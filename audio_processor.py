@@ -1,90 +1,480 @@
 import os
-import librosa
+import subprocess
+import tempfile
 import numpy as np
-from pydub import AudioSegment
-from pydub.utils import make_chunks
 import logging
-from config import MUSICA_DIR, FILES_CONFIG, AUDIO_CONFIG, PROCESS_CONFIG
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from config import (
+    MUSICA_DIR, TEMP_DIR, FILES_CONFIG, AUDIO_CONFIG, AUDIO_FORMATS, PROCESS_CONFIG, CACHE_CONFIG
+)
+from cache import DiskCache, get_audio_cache
+from ffmpeg_pipe import iter_pcm_blocks, read_log_tail
+from library_index import LibraryIndex
+from loudness import LOUDNESS_VERSION, LoudnessMeter, loudness_gain, peak_gain
+from utils import load_json_file, save_json_file
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Versión del manifiesto de segmentos: 2 guarda las longitudes decodificadas
+MANIFEST_VERSION = 2
+
 class AudioProcessor:
     def __init__(self):
         self.supported_formats = PROCESS_CONFIG['supported_formats']
         self.repeat_count = PROCESS_CONFIG['repeat_count']
         self.sample_rate = AUDIO_CONFIG['sample_rate']
+        self.channels = AUDIO_CONFIG['channels']
+        self.chunk_seconds = AUDIO_CONFIG['stream_chunk_seconds']
+        self.headroom_db = AUDIO_CONFIG['normalize_headroom_db']
+        self.max_workers = PROCESS_CONFIG['max_concurrent_processes']
+        self.normalization = AUDIO_CONFIG['normalization']
+        self.target_lufs = AUDIO_CONFIG['target_lufs']
+        self.true_peak_ceiling_db = AUDIO_CONFIG['true_peak_ceiling_db']
+        self.library = LibraryIndex()
+        self.cache_enabled = CACHE_CONFIG['audio_cache_enabled']
+        self.incremental = AUDIO_CONFIG['incremental']
+        self.segments_dir = CACHE_CONFIG['segments_dir']
+        self.manifest_path = CACHE_CONFIG['build_manifest']
         
     def get_audio_files(self, music_dir=MUSICA_DIR):
-        """Obtiene lista de archivos de audio de la carpeta música"""
-        audio_files = []
-        
-        if not os.path.exists(music_dir):
-            logger.error(f"La carpeta {music_dir} no existe")
-            return audio_files
-            
-        for file in os.listdir(music_dir):
-            if any(file.lower().endswith(ext) for ext in self.supported_formats):
-                file_path = os.path.join(music_dir, file)
-                audio_files.append(file_path)
+        """Obtiene lista de archivos de audio de la carpeta música (y subcarpetas)
         
-        # Ordenar alfabéticamente para consistencia
-        audio_files.sort()
+        Consulta el índice de la biblioteca, que solo vuelve a analizar los
+        archivos nuevos o modificados y memoriza el escaneo para toda la ejecución.
+        """
+        audio_files = self.library.scan(music_dir)
         logger.info(f"Encontrados {len(audio_files)} archivos de audio")
         
         return audio_files
     
     def get_audio_duration(self, audio_path):
-        """Obtiene la duración de un archivo de audio en segundos"""
+        """Obtiene la duración de un archivo de audio en segundos
+        
+        Usa el índice de la biblioteca (metadatos del contenedor vía ffprobe); solo
+        decodifica el archivo completo si los metadatos no traen la duración.
+        """
         try:
-            audio = AudioSegment.from_file(audio_path)
-            return len(audio) / 1000.0  # Convertir de ms a segundos
+            duration = self.library.get_duration(audio_path)
+            if duration is not None:
+                return duration
+            
+            logger.info(f"Sin duración en metadatos, decodificando: {os.path.basename(audio_path)}")
+            duration = self.decode_duration(audio_path)
+            self.library.set_duration(audio_path, duration)
+            return duration
         except Exception as e:
             logger.error(f"Error al obtener duración de {audio_path}: {e}")
             return 0.0
     
+    def decode_duration(self, audio_path):
+        """Duración exacta contando las muestras decodificadas por bloques"""
+        return self.count_samples(audio_path) / float(self.sample_rate)
+    
+    def count_samples(self, audio_path):
+        """Muestras por canal que entrega ffmpeg al decodificar el archivo completo"""
+        total_samples = 0
+        for chunk in self.iter_pcm_chunks(audio_path):
+            total_samples += chunk.size
+        return total_samples // self.channels
+    
+    def iter_pcm_chunks(self, audio_path):
+        """Decodifica un archivo con ffmpeg y entrega bloques PCM int16 de tamaño acotado"""
+        block_samples = int(self.chunk_seconds * self.sample_rate)
+        return iter_pcm_blocks(audio_path, self.sample_rate, self.channels, block_samples)
+    
+    def get_track_gain(self, analysis):
+        """Ganancia lineal a aplicar a una pista según el modo de normalización"""
+        if self.normalization == 'loudness':
+            return loudness_gain(analysis, self.target_lufs, self.true_peak_ceiling_db)
+        return peak_gain(analysis, self.headroom_db)
+    
+    def open_audio_encoder(self, output_path, muxer=None, codec=None, muxer_options=()):
+        """Abre un proceso ffmpeg que codifica PCM int16 recibido por stdin
+        
+        El audio combinado se codifica una única vez en el formato configurado
+        (AAC final, FLAC o PCM sin pérdidas) para que el video pueda copiarlo.
+        """
+        audio_format = AUDIO_FORMATS[AUDIO_CONFIG['format']]
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 's16le',
+            '-ar', str(self.sample_rate),
+            '-ac', str(self.channels),
+            '-i', 'pipe:0',
+            '-c:a', codec or audio_format['codec']
+        ]
+        if audio_format['lossy'] and codec is None:
+            cmd.extend(['-b:a', AUDIO_CONFIG['quality']])
+        cmd.extend(muxer_options)
+        cmd.extend(['-f', muxer or audio_format['muxer'], output_path])
+        # stderr a un archivo temporal: una tubería sin vaciar podría bloquear a ffmpeg
+        stderr_file = tempfile.TemporaryFile()
+        encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=stderr_file)
+        encoder.stderr_file = stderr_file
+        return encoder
+    
+    def close_audio_encoder(self, encoder):
+        """Cierra el codificador y verifica que terminó correctamente"""
+        try:
+            encoder.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = encoder.wait()
+        stderr = read_log_tail(encoder.stderr_file)
+        encoder.stderr_file.close()
+        if returncode != 0:
+            raise RuntimeError(f"Error en ffmpeg al codificar audio: {stderr}")
+    
+    def abort_audio_encoder(self, encoder):
+        """Termina el codificador tras un error y devuelve el final de su stderr"""
+        if encoder.stderr_file.closed:
+            # close_audio_encoder ya esperó al proceso e informó del error
+            return ''
+        encoder.kill()
+        try:
+            encoder.stdin.close()
+        except BrokenPipeError:
+            pass
+        encoder.wait()
+        stderr = read_log_tail(encoder.stderr_file)
+        encoder.stderr_file.close()
+        return stderr
+    
+    def decode_and_analyze(self, audio_path, output_path):
+        """Decodifica una pista una sola vez a PCM crudo y mide su sonoridad en la misma pasada"""
+        return decode_and_analyze(audio_path, output_path, **self.get_decode_params())
+    
+    def get_decode_params(self):
+        """Parámetros de decode_and_analyze (serializables para el pool de procesos)"""
+        return {
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'block_samples': int(self.chunk_seconds * self.sample_rate)
+        }
+    
+    def append_intermediate(self, pcm_path, gain, encoder):
+        """Copia por bloques un intermedio PCM al codificador aplicando la ganancia"""
+        chunk_bytes = int(self.chunk_seconds * self.sample_rate) * self.channels * 2
+        with open(pcm_path, 'rb') as f:
+            while True:
+                data = f.read(chunk_bytes)
+                if not data:
+                    break
+                if gain != 1.0:
+                    scaled = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+                    scaled *= gain
+                    np.clip(scaled, -32768, 32767, out=scaled)
+                    data = scaled.astype(np.int16).tobytes()
+                encoder.stdin.write(data)
+    
+    def get_intermediate_path(self, index, audio_path):
+        """Ruta del intermedio PCM de una pista de la lista"""
+        base_name = os.path.splitext(os.path.basename(audio_path))[0]
+        return os.path.join(TEMP_DIR, f"norm_{index:03d}_{base_name}.pcm")
+    
+    def build_playlist(self, audio_files):
+        """Lista de reproducción completa (la lista repetida según configuración)"""
+        return audio_files * self.repeat_count
+    
+    def get_unique_tracks(self, playlist):
+        """Pistas distintas de la lista, en orden de primera aparición"""
+        return list(dict.fromkeys(playlist))
+    
+    def get_cache_key(self, audio_path):
+        """Clave de caché: huella del contenido más los parámetros de procesamiento"""
+        fingerprint = self.library.get_fingerprint(audio_path)
+        if fingerprint is None:
+            return None
+        return DiskCache.make_key(
+            fingerprint, self.sample_rate, self.channels, 'pcm_s16le',
+            LOUDNESS_VERSION, self.normalization, self.headroom_db, self.target_lufs, self.true_peak_ceiling_db
+        )
+    
+    def iter_intermediates(self, tracks):
+        """Entrega (pista, intermedio PCM, ganancia) para cada pista, en el orden dado
+        
+        Los intermedios se toman de la caché de audio cuando existen; el resto se
+        decodifica y analiza en el pool de procesos. Al cerrar el generador se
+        guardan las nuevas entradas en la caché y se borran los temporales.
+        """
+        cache = get_audio_cache() if self.cache_enabled else None
+        cache_keys = {}
+        ready = {}
+        pending = []
+        for audio_file in tracks:
+            if cache is not None:
+                cache_keys[audio_file] = self.get_cache_key(audio_file)
+                cached_path = cache.lookup(cache_keys[audio_file]) if cache_keys[audio_file] else None
+                if cached_path:
+                    ready[audio_file] = (cached_path, cache.get_metadata(cache_keys[audio_file])['gain'])
+                    continue
+            pending.append(audio_file)
+        
+        if cache is not None:
+            logger.info(f"Caché de audio: {len(ready)} aciertos, {len(pending)} pistas por procesar")
+        
+        os.makedirs(TEMP_DIR, exist_ok=True)
+        intermediates = [
+            self.get_intermediate_path(i, audio_file) for i, audio_file in enumerate(pending)
+        ]
+        max_workers = max(1, min(self.max_workers, len(pending)))
+        logger.info(f"Decodificando y analizando sonoridad con {max_workers} procesos")
+        
+        try:
+            # 'spawn' evita que los workers hereden por fork las tuberías de los
+            # procesos ffmpeg abiertos (el codificador no recibiría el fin de datos)
+            with ProcessPoolExecutor(max_workers=max_workers,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                # Las pistas se procesan en paralelo; los resultados llegan en orden de aparición
+                analyze = partial(decode_and_analyze, **self.get_decode_params())
+                results = zip(pending, intermediates, executor.map(analyze, pending, intermediates))
+                
+                for audio_file in tracks:
+                    while audio_file not in ready:
+                        track, pcm_path, analysis = next(results)
+                        gain = self.get_track_gain(analysis)
+                        logger.info(f"{os.path.basename(track)}: {analysis['integrated_lufs']:.1f} LUFS, "
+                                    f"pico verdadero {analysis['true_peak_db']:.1f} dBTP, "
+                                    f"ganancia {20 * np.log10(gain):+.1f} dB")
+                        if cache is not None and cache_keys[track]:
+                            pcm_path = cache.store(cache_keys[track], pcm_path, '.pcm', {
+                                'source': os.path.basename(track),
+                                'analysis': analysis,
+                                'gain': gain
+                            })
+                        ready[track] = (pcm_path, gain)
+                    
+                    yield (audio_file,) + ready[audio_file]
+        
+        finally:
+            for pcm_path in intermediates:
+                if os.path.exists(pcm_path):
+                    os.remove(pcm_path)
+            
+            if cache is not None:
+                cache.evict(keep=set(cache_keys.values()))
+                cache.save()
+                self.library.save()
+    
     def combine_audio_files(self, audio_files, output_path=None):
-        """Combina archivos de audio en el orden especificado (repetido 2 veces)"""
+        """Combina archivos de audio en el orden especificado (repetido según configuración)
+        
+        Cada pista distinta se decodifica y analiza una sola vez en el pool de
+        procesos; la ganancia de normalización se aplica al unir, por streaming.
+        Las repeticiones reutilizan el mismo intermedio, y los intermedios (con
+        su ganancia) se guardan en la caché de audio para ejecuciones futuras.
+        
+        Devuelve la ruta del audio combinado y las muestras que ocupa cada pista
+        de la lista en él, contadas al decodificar: la duración de los metadatos
+        puede diferir (un MP3 VBR sin cabecera) y desplazaría el video.
+        """
         if not audio_files:
             logger.error("No hay archivos de audio para combinar")
-            return None
+            return None, None
             
         if output_path is None:
             output_path = FILES_CONFIG['combined_audio']
             
+        encoder = None
+        intermediates = None
         try:
             # Crear lista de archivos repetida según configuración
-            playlist = audio_files * self.repeat_count
-            logger.info(f"Combinando {len(playlist)} archivos (lista repetida {self.repeat_count} veces)")
+            playlist = self.build_playlist(audio_files)
+            unique_tracks = self.get_unique_tracks(playlist)
+            logger.info(f"Combinando {len(playlist)} archivos (lista repetida {self.repeat_count} veces, "
+                        f"{len(unique_tracks)} pistas únicas)")
+            
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            
+            if self.incremental:
+                return self.combine_incremental(playlist, unique_tracks, output_path)
             
-            # Inicializar con silencio
-            combined_audio = AudioSegment.silent(duration=0)
+            intermediates = self.iter_intermediates(unique_tracks)
+            ready = {}
+            track_samples = []
             
-            # Combinar archivos secuencialmente
+            # Unir los intermedios terminados en el orden de la lista
             for i, audio_file in enumerate(playlist):
-                logger.info(f"Procesando archivo {i+1}/{len(playlist)}: {os.path.basename(audio_file)}")
-                
-                # Cargar archivo de audio
-                audio_segment = AudioSegment.from_file(audio_file)
-                
-                # Normalizar el volumen si es necesario
-                audio_segment = audio_segment.normalize()
+                while audio_file not in ready:
+                    track, pcm_path, gain = next(intermediates)
+                    ready[track] = (pcm_path, gain)
                 
-                # Añadir al audio combinado
-                combined_audio += audio_segment
+                if encoder is None:
+                    # Abrir el codificador con el pool ya en marcha: ningún worker
+                    # puede heredar su stdin, sea cual sea el método de arranque
+                    encoder = self.open_audio_encoder(output_path)
                 
-            # Exportar el archivo combinado
-            combined_audio.export(output_path, format="mp3", bitrate=AUDIO_CONFIG['quality'])
+                logger.info(f"Añadiendo archivo {i+1}/{len(playlist)}: {os.path.basename(audio_file)}")
+                self.append_intermediate(*ready[audio_file], encoder=encoder)
+                track_samples.append(os.path.getsize(ready[audio_file][0]) // (2 * self.channels))
+            
+            self.close_audio_encoder(encoder)
+            encoder = None
             logger.info(f"Audio combinado guardado en: {output_path}")
             
-            return output_path
+            return output_path, track_samples
             
         except Exception as e:
             logger.error(f"Error al combinar archivos de audio: {e}")
+            if encoder is not None:
+                stderr = self.abort_audio_encoder(encoder)
+                if stderr:
+                    logger.error(f"Salida de ffmpeg: {stderr}")
+            return None, None
+        
+        finally:
+            if intermediates is not None:
+                intermediates.close()
+    
+    def get_segment_key(self, audio_path):
+        """Clave del segmento codificado de una pista (intermedio + formato de salida)"""
+        track_key = self.get_cache_key(audio_path)
+        if track_key is None:
             return None
+        return DiskCache.make_key(track_key, AUDIO_CONFIG['format'], AUDIO_CONFIG['quality'])
     
-    def generate_description_file(self, audio_files, output_path=None):
-        """Genera archivo de descripción con los tiempos de cada canción"""
+    def encode_segment(self, pcm_path, gain, segment_path):
+        """Codifica una pista como segmento independiente alineado a frames del códec
+        
+        El PCM se rellena con silencio hasta un múltiplo del tamaño de frame, de
+        modo que cada segmento termina en un límite de frame. Devuelve las
+        muestras que produce el segmento al decodificarlo: un stream crudo (ADTS,
+        MP3 sin cabecera Xing) no guarda el retardo del codificador, así que la
+        unión por copia de stream conserva el priming y el relleno de cada
+        segmento y los offsets del manifiesto deben incluirlos.
+        """
+        audio_format = AUDIO_FORMATS[AUDIO_CONFIG['format']]
+        encoder = self.open_audio_encoder(
+            segment_path, muxer=audio_format['segment_muxer'], codec=audio_format.get('segment_codec'),
+            muxer_options=audio_format.get('segment_options', ())
+        )
+        try:
+            self.append_intermediate(pcm_path, gain, encoder)
+            
+            frame_samples = os.path.getsize(pcm_path) // (2 * self.channels)
+            padding = -frame_samples % audio_format['frame_size']
+            if padding:
+                encoder.stdin.write(np.zeros(padding * self.channels, dtype=np.int16).tobytes())
+            
+            self.close_audio_encoder(encoder)
+        except BrokenPipeError:
+            # El codificador terminó antes de tiempo: el motivo está en su stderr
+            raise RuntimeError(f"Error en ffmpeg al codificar {segment_path}: "
+                               f"{self.abort_audio_encoder(encoder)}") from None
+        except Exception:
+            self.abort_audio_encoder(encoder)
+            raise
+        
+        return self.count_samples(segment_path)
+    
+    def combine_incremental(self, playlist, unique_tracks, output_path):
+        """Reconstrucción incremental: solo se codifican las pistas nuevas o modificadas
+        
+        Cada pista se guarda como segmento codificado junto a un manifiesto con
+        su huella y su offset; los segmentos se unen con el demuxer concat de
+        ffmpeg copiando el stream, sin recodificar lo que no cambió.
+        """
+        audio_format = AUDIO_FORMATS[AUDIO_CONFIG['format']]
+        manifest = load_json_file(self.manifest_path, default={})
+        previous = manifest.get('segments', {})
+        # Los manifiestos de otra versión no tienen las longitudes decodificadas
+        reusable = previous if manifest.get('version') == MANIFEST_VERSION else {}
+        os.makedirs(self.segments_dir, exist_ok=True)
+        
+        # Segmentos reutilizables de la construcción anterior
+        segment_keys = {audio_file: self.get_segment_key(audio_file) for audio_file in unique_tracks}
+        segments = {}
+        changed = []
+        for audio_file, key in segment_keys.items():
+            entry = reusable.get(key) if key else None
+            if entry and os.path.exists(os.path.join(self.segments_dir, entry['file'])):
+                segments[key] = entry
+            else:
+                changed.append(audio_file)
+        
+        logger.info(f"Construcción incremental: {len(unique_tracks) - len(changed)} segmentos reutilizados, "
+                    f"{len(changed)} por codificar")
+        
+        # Codificar solo las pistas nuevas o modificadas
+        if changed:
+            intermediates = self.iter_intermediates(changed)
+            try:
+                for audio_file, pcm_path, gain in intermediates:
+                    key = segment_keys[audio_file] or DiskCache.make_key(os.path.abspath(audio_file))
+                    segment_file = key + audio_format['segment_extension']
+                    logger.info(f"Codificando segmento: {os.path.basename(audio_file)}")
+                    samples = self.encode_segment(pcm_path, gain, os.path.join(self.segments_dir, segment_file))
+                    segment_keys[audio_file] = key
+                    segments[key] = {
+                        'file': segment_file,
+                        'samples': samples,
+                        'source': os.path.abspath(audio_file)
+                    }
+            finally:
+                intermediates.close()
+        
+        # Lista del demuxer concat en orden de reproducción, con los offsets de cada pista
+        list_path = os.path.join(self.segments_dir, 'concat.txt')
+        order = []
+        offset = 0
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for audio_file in playlist:
+                key = segment_keys[audio_file]
+                segment_path = os.path.join(self.segments_dir, segments[key]['file'])
+                escaped = segment_path.replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+                order.append({
+                    'key': key,
+                    'offset': offset / float(self.sample_rate),
+                    'samples': segments[key]['samples']
+                })
+                offset += segments[key]['samples']
+        
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'concat', '-safe', '0',
+            '-i', list_path,
+            # Copia de stream salvo que los segmentos sean PCM de un formato sin pérdidas
+            '-c:a', audio_format['codec'] if 'segment_codec' in audio_format else 'copy',
+            *audio_format.get('segment_options', ()),
+            '-f', audio_format['muxer'],
+            output_path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Error en ffmpeg al unir segmentos: {result.stderr}")
+        
+        # Borrar segmentos que ya no forman parte de la lista
+        for key, entry in previous.items():
+            if key not in segments:
+                stale_path = os.path.join(self.segments_dir, entry['file'])
+                if os.path.exists(stale_path):
+                    os.remove(stale_path)
+        
+        save_json_file(self.manifest_path, {
+            'version': MANIFEST_VERSION,
+            'format': AUDIO_CONFIG['format'],
+            'sample_rate': self.sample_rate,
+            'segments': segments,
+            'playlist': order
+        })
+        
+        logger.info(f"Audio combinado guardado en: {output_path}")
+        return output_path, [entry['samples'] for entry in order]
+    
+    def get_track_durations(self, track_samples):
+        """Duración en segundos de cada pista de la lista a partir de sus muestras"""
+        return [samples / float(self.sample_rate) for samples in track_samples]
+    
+    def generate_description_file(self, audio_files, output_path=None, track_samples=None):
+        """Genera archivo de descripción con los tiempos de cada canción
+        
+        Con track_samples (las de combine_audio_files) los tiempos coinciden
+        exactamente con el audio combinado; si no, se usan los metadatos.
+        """
         if not audio_files:
             logger.error("No hay archivos de audio para generar descripción")
             return None
@@ -94,7 +484,7 @@ class AudioProcessor:
             
         try:
             # Crear lista de archivos repetida según configuración
-            playlist = audio_files * self.repeat_count
+            playlist = self.build_playlist(audio_files)
             
             description_lines = []
             current_time = 0.0
@@ -104,9 +494,20 @@ class AudioProcessor:
             description_lines.append(f"Repeticiones: {self.repeat_count}")
             description_lines.append("\n=== TIEMPOS DE REPRODUCCIÓN ===\n")
             
+            if track_samples is not None:
+                durations = self.get_track_durations(track_samples)
+            else:
+                # Duración de cada archivo único (los ciclos repetidos reutilizan el valor)
+                unique_durations = {
+                    audio_file: self.get_audio_duration(audio_file)
+                    for audio_file in self.get_unique_tracks(audio_files)
+                }
+                self.library.save()
+                durations = [unique_durations[audio_file] for audio_file in playlist]
+            
             for i, audio_file in enumerate(playlist):
                 song_name = os.path.splitext(os.path.basename(audio_file))[0]
-                duration = self.get_audio_duration(audio_file)
+                duration = durations[i]
                 
                 # Convertir tiempo actual a formato mm:ss
                 minutes = int(current_time // 60)
@@ -139,7 +540,10 @@ class AudioProcessor:
             return None
     
     def process_audio(self, music_dir=None):
-        """Procesa todo el audio: combina archivos y genera descripción"""
+        """Procesa todo el audio: combina archivos y genera descripción
+        
+        Devuelve (audio combinado, descripción, muestras de cada pista de la lista).
+        """
         if music_dir is None:
             music_dir = MUSICA_DIR
             
@@ -149,26 +553,40 @@ class AudioProcessor:
         audio_files = self.get_audio_files(music_dir)
         if not audio_files:
             logger.error("No se encontraron archivos de audio")
-            return None, None
+            return None, None, None
             
         # Combinar archivos de audio
-        combined_audio_path = self.combine_audio_files(audio_files)
+        combined_audio_path, track_samples = self.combine_audio_files(audio_files)
         if not combined_audio_path:
             logger.error("Error al combinar archivos de audio")
-            return None, None
+            return None, None, None
             
         # Generar archivo de descripción
-        description_path = self.generate_description_file(audio_files)
+        description_path = self.generate_description_file(audio_files, track_samples=track_samples)
         if not description_path:
             logger.error("Error al generar archivo de descripción")
-            return combined_audio_path, None
+            return combined_audio_path, None, track_samples
             
         logger.info("Procesamiento de audio completado exitosamente")
-        return combined_audio_path, description_path
+        return combined_audio_path, description_path, track_samples
+
+def decode_and_analyze(audio_path, output_path, sample_rate, channels, block_samples):
+    """Tarea del pool de procesos: decodifica una pista a PCM y mide su sonoridad
+    
+    Es una función de módulo para que los workers no creen un AudioProcessor
+    (ni carguen el índice de la biblioteca) en cada tarea.
+    """
+    meter = LoudnessMeter(sample_rate, channels)
+    with open(output_path, 'wb') as f:
+        for chunk in iter_pcm_blocks(audio_path, sample_rate, channels, block_samples):
+            meter.add_chunk(chunk)
+            f.write(chunk.tobytes())
+    
+    return meter.result()
 
 if __name__ == "__main__":
     processor = AudioProcessor()
-    audio_path, desc_path = processor.process_audio()
+    audio_path, desc_path, _ = processor.process_audio()
     
     if audio_path and desc_path:
         print(f"Audio combinado: {audio_path}")
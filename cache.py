@@ -0,0 +1,154 @@
+"""
+Cachés persistentes en disco para el generador de videos musicales
+"""
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import json
+import logging
+import argparse
+from config import CACHE_CONFIG
+from utils import load_json_file, save_json_file, format_file_size, ensure_directory
+
+logger = logging.getLogger(__name__)
+
+class DiskCache:
+    """Caché direccionada por contenido con límite de tamaño y expulsión LRU"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, 'index.json')
+        self.entries = load_json_file(self.index_path, default={})
+
+    @staticmethod
+    def make_key(*parts):
+        """Clave estable a partir de la huella y los parámetros de procesamiento"""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, key, extension=''):
+        """Ruta del archivo de una entrada dentro de la caché"""
+        return os.path.join(self.directory, key[:2], key + extension)
+
+    def lookup(self, key):
+        """Ruta de la entrada si existe (y la marca como usada), o None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        path = os.path.join(self.directory, entry['file'])
+        if not os.path.exists(path):
+            # Entrada huérfana: el archivo se borró por fuera
+            del self.entries[key]
+            return None
+
+        entry['last_access'] = time.time()
+        return path
+
+    def get_metadata(self, key):
+        """Metadatos asociados a una entrada"""
+        entry = self.entries.get(key)
+        return entry.get('meta', {}) if entry else {}
+
+    def store(self, key, source_path, extension='', metadata=None):
+        """Mover un archivo terminado a la caché y registrarlo"""
+        path = self.path_for(key, extension)
+        ensure_directory(os.path.dirname(path))
+        shutil.move(source_path, path)
+
+        self.entries[key] = {
+            'file': os.path.relpath(path, self.directory),
+            'size': os.path.getsize(path),
+            'last_access': time.time(),
+            'meta': metadata or {}
+        }
+        return path
+
+    def total_size(self):
+        """Tamaño total ocupado por las entradas registradas"""
+        return sum(entry['size'] for entry in self.entries.values())
+
+    def evict(self, max_bytes=None, keep=()):
+        """Eliminar las entradas menos usadas hasta quedar bajo el límite"""
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+
+        total = self.total_size()
+        removed = 0
+        for key in sorted(self.entries, key=lambda k: self.entries[k]['last_access']):
+            if total <= max_bytes:
+                break
+            if key in keep:
+                continue
+            entry = self.entries.pop(key)
+            path = os.path.join(self.directory, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+            total -= entry['size']
+            removed += 1
+
+        if removed:
+            logger.info(f"Caché {self.directory}: {removed} entradas expulsadas "
+                        f"({format_file_size(total)} en uso)")
+        return removed
+
+    def clear(self):
+        """Vaciar la caché por completo"""
+        return self.evict(max_bytes=0)
+
+    def save(self):
+        """Escribir el índice en disco"""
+        return save_json_file(self.index_path, self.entries)
+
+def get_audio_cache():
+    """Caché de intermedios de audio normalizados"""
+    return DiskCache(CACHE_CONFIG['audio_cache_dir'], CACHE_CONFIG['audio_cache_max_bytes'])
+
+def get_feature_cache():
+    """Caché de espectrogramas de mel normalizados del visualizador"""
+    return DiskCache(CACHE_CONFIG['feature_cache_dir'], CACHE_CONFIG['feature_cache_max_bytes'])
+
+def get_all_caches():
+    """Cachés con tamaño limitado gestionables desde la línea de comandos"""
+    return {
+        'audio': get_audio_cache(),
+        'features': get_feature_cache()
+    }
+
+def main():
+    """Inspeccionar y podar las cachés desde la línea de comandos"""
+    parser = argparse.ArgumentParser(description='Gestión de la caché del generador de videos')
+    parser.add_argument('command', choices=['info', 'prune', 'clear'],
+                       help='info: mostrar uso, prune: aplicar límite de tamaño, clear: vaciar')
+    parser.add_argument('--cache', choices=['all', 'audio', 'features'], default='all',
+                       help='Caché sobre la que actuar')
+    parser.add_argument('--max-mb', type=float, default=None,
+                       help='Límite de tamaño en MB para prune (por defecto el configurado)')
+
+    args = parser.parse_args()
+
+    caches = get_all_caches()
+    if args.cache != 'all':
+        caches = {args.cache: caches[args.cache]}
+
+    for name, cache in caches.items():
+        if args.command == 'prune':
+            max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None
+            cache.evict(max_bytes)
+            cache.save()
+        elif args.command == 'clear':
+            cache.clear()
+            cache.save()
+
+        print(f"{name}: {len(cache.entries)} entradas, {format_file_size(cache.total_size())} "
+              f"(límite {format_file_size(cache.max_bytes)}) en {cache.directory}")
+
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
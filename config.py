@@ -6,6 +6,7 @@ MUSICA_DIR = os.path.join(BASE_DIR, "musica")
 RECURSOS_DIR = os.path.join(BASE_DIR, "recursos")
 TEMP_DIR = os.path.join(BASE_DIR, "temp")
 OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
 
 # Video configurations / Configuraciones de video
 VIDEO_CONFIG = {
@@ -28,15 +29,44 @@ VISUALIZER_CONFIG = {
     "gap": 5,
     "vertical_offset": 140,
     "n_fft": 2048,
-    "power": 1.0
+    "power": 1.0,
+    "streaming_analysis": True,     # Analizar por bloques (memoria acotada) en lugar de cargar la pista entera
+    "analysis_block_seconds": 10,   # Tamaño de bloque del análisis por streaming
+    "analysis_sample_rate": 44100,  # Frecuencia común de análisis (None = la de cada archivo)
+    "mel_backend": "numpy",         # Motor del espectrograma: "numpy" o "librosa" (opcional)
+    "region_of_interest": True,     # Emitir solo la franja de las barras (se superpone en su posición)
+    "output_alpha": True            # Frames BGRA con canal alfa real (sin chroma key en la composición)
 }
 
 # Configuraciones de audio
 AUDIO_CONFIG = {
     "sample_rate": 44100,
     "channels": 2,
-    "format": "mp3",
-    "quality": "320k"
+    "format": "aac",                # Formato del audio combinado (ver AUDIO_FORMATS)
+    "quality": "320k",
+    "stream_chunk_seconds": 5,      # Tamaño de bloque al decodificar/combinar por streaming
+    "normalize_headroom_db": 0.1,   # Margen del modo "peak" (igual que pydub normalize)
+    "normalization": "loudness",    # "loudness" (BS.1770, LUFS) o "peak"
+    "target_lufs": -14.0,           # Sonoridad integrada objetivo del modo "loudness"
+    "true_peak_ceiling_db": -1.0,   # Techo de pico verdadero tras aplicar la ganancia
+    "incremental": False            # Reutilizar segmentos codificados de la construcción anterior
+}
+
+# Formatos del audio combinado: se codifica una sola vez y, si coincide con
+# VIDEO_CONFIG['audio_codec'], el video lo copia con -c:a copy
+# (los segmentos de la construcción incremental usan un muxer de stream crudo
+# y se alinean a "frame_size" muestras para unirse con copia de stream)
+AUDIO_FORMATS = {
+    "aac": {"extension": ".m4a", "muxer": "ipod", "codec": "aac", "lossy": True,
+            "segment_extension": ".aac", "segment_muxer": "adts", "frame_size": 1024},
+    "flac": {"extension": ".flac", "muxer": "flac", "codec": "flac", "lossy": False,
+             "segment_extension": ".wav", "segment_muxer": "wav", "segment_codec": "pcm_s16le",
+             "frame_size": 1},  # FLAC no admite unión por copia: segmentos PCM + codificación sin pérdidas
+    "pcm": {"extension": ".wav", "muxer": "wav", "codec": "pcm_s16le", "lossy": False,
+            "segment_extension": ".wav", "segment_muxer": "wav", "frame_size": 1},
+    "mp3": {"extension": ".mp3", "muxer": "mp3", "codec": "libmp3lame", "lossy": True,
+            "segment_extension": ".mp3", "segment_muxer": "mp3", "frame_size": 1152,
+            "segment_options": ["-write_xing", "0"]}  # Sin cabecera Xing: el retardo no se recorta solo en el primer segmento
 }
 
 # Function to find background image with any supported extension
@@ -56,7 +86,7 @@ def get_background_image_path():
 # Configuraciones de archivos
 FILES_CONFIG = {
     "background_image": get_background_image_path(),
-    "combined_audio": os.path.join(TEMP_DIR, "combined_audio.mp3"),
+    "combined_audio": os.path.join(TEMP_DIR, "combined_audio" + AUDIO_FORMATS[AUDIO_CONFIG['format']]['extension']),
     "description_file": os.path.join(OUTPUT_DIR, "descripcion.txt"),
     "final_video": os.path.join(OUTPUT_DIR, "video_final.mp4"),
     "temp_video_prefix": os.path.join(TEMP_DIR, "temp_video_"),
@@ -68,9 +98,41 @@ PROCESS_CONFIG = {
     "repeat_count": 1,  # Cuántas veces se repite la lista de canciones
     "supported_formats": ['.mp3', '.wav', '.flac', '.m4a', '.ogg'],
     "max_concurrent_processes": 4,
+    "visualization_executor": "process",  # "process" (un visualizador por núcleo) o "thread"
+    "visualization_shard_seconds": 120,   # Las pistas más largas se renderizan en fragmentos paralelos
+    "render_mode": "fused",  # "fused": barras sobre el fondo directo al codificador; "composite": viz_* + video base
+    "composite_workers": None,     # Hilos de composición en modo "composite" (None = un hilo por núcleo)
+    "composite_queue_size": 8,     # Frames en cola entre decodificación, composición y codificación
     "temp_cleanup": True
 }
 
+# Configuraciones de caché persistente
+CACHE_CONFIG = {
+    "library_index": os.path.join(CACHE_DIR, "library.json"),
+    "audio_cache_enabled": True,
+    "audio_cache_dir": os.path.join(CACHE_DIR, "audio"),
+    "audio_cache_max_bytes": 10 * 1024 ** 3,  # 10 GB de intermedios normalizados
+    "feature_cache_enabled": True,
+    "feature_cache_dir": os.path.join(CACHE_DIR, "features"),
+    "feature_cache_max_bytes": 2 * 1024 ** 3,  # 2 GB de espectrogramas float16
+    "segments_dir": os.path.join(CACHE_DIR, "segments"),
+    "build_manifest": os.path.join(CACHE_DIR, "segments", "manifest.json")
+}
+
+# Perfiles de códec para los frames enviados a ffmpeg por tubería (ffmpeg_pipe.py)
+FRAME_PIPE_CONFIG = {
+    # Intermedios de visualización: H.264 RGB sin pérdidas, conserva el verde exacto del chroma key
+    # (GOP cerrado para unir fragmentos renderizados por separado sin recodificar)
+    "visualization": {"codec": "libx264rgb", "preset": "ultrafast", "pix_fmt": "bgr24",
+                      "options": ["-qp", "0", "-flags", "+cgop"], "extension": ".mp4"},
+    # Intermedios con canal alfa (VISUALIZER_CONFIG['output_alpha']): FFV1 sin pérdidas, solo intra
+    "visualization_alpha": {"codec": "ffv1", "pix_fmt": "bgra", "options": ["-level", "3", "-g", "1"],
+                            "extension": ".mkv"},
+    # Video final compuesto
+    "final": {"codec": VIDEO_CONFIG['video_codec'], "preset": "medium", "pix_fmt": "yuv420p",
+              "bitrate": VIDEO_CONFIG['bitrate'], "options": []}
+}
+
 # Configuraciones de logging
 LOGGING_CONFIG = {
     "level": "INFO",
@@ -0,0 +1,203 @@
+"""
+Lectura y escritura por tubería con procesos ffmpeg: frames (rawvideo) y audio PCM
+"""
+
+import subprocess
+import tempfile
+import logging
+import numpy as np
+from config import FRAME_PIPE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Formatos PCM crudos que entrega iter_pcm_blocks
+PCM_FORMATS = {
+    's16le': np.int16,
+    'f32le': np.float32
+}
+
+def read_log_tail(log_file, limit=4096):
+    """Final del stderr de ffmpeg guardado en un archivo temporal: basta para identificar el error"""
+    log_file.seek(0)
+    return log_file.read()[-limit:].decode(errors='replace').strip()
+
+def iter_pcm_blocks(audio_path, sample_rate, channels, block_samples, sample_format='s16le'):
+    """Decodifica audio con ffmpeg y entrega bloques PCM de block_samples muestras por canal
+
+    stderr se escribe en un archivo temporal y no en una tubería: con un
+    archivo dañado ffmpeg puede emitir más avisos de los que caben en el
+    búfer de la tubería y, si nadie la vacía mientras se lee stdout, ffmpeg
+    y el lector quedan bloqueados esperándose mutuamente.
+    """
+    dtype = PCM_FORMATS[sample_format]
+    cmd = [
+        'ffmpeg', '-v', 'error',
+        '-i', audio_path,
+        '-f', sample_format,
+        '-acodec', f'pcm_{sample_format}',
+        '-ar', str(sample_rate),
+        '-ac', str(channels),
+        'pipe:1'
+    ]
+    block_bytes = block_samples * channels * np.dtype(dtype).itemsize
+
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+        completed = False
+        try:
+            while True:
+                data = process.stdout.read(block_bytes)
+                if not data:
+                    break
+                yield np.frombuffer(data, dtype=dtype)
+            completed = True
+        finally:
+            if not completed:
+                # El consumidor abandonó la lectura: terminar el proceso
+                process.kill()
+            process.stdout.close()
+            returncode = process.wait()
+
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg no pudo decodificar {audio_path}: {read_log_tail(stderr_file)}")
+
+def build_codec_args(profile):
+    """Argumentos de códec de video de un perfil de FRAME_PIPE_CONFIG"""
+    settings = FRAME_PIPE_CONFIG[profile] if isinstance(profile, str) else profile
+    args = ['-c:v', settings['codec']]
+    if settings.get('preset'):
+        args += ['-preset', settings['preset']]
+    if settings.get('bitrate'):
+        args += ['-b:v', settings['bitrate']]
+    args += list(settings.get('options', []))
+    if settings.get('pix_fmt'):
+        args += ['-pix_fmt', settings['pix_fmt']]
+    return args
+
+class FFmpegFrameWriter:
+    """Sumidero de frames BGR que los codifica con un único proceso ffmpeg
+
+    Los frames se envían sin comprimir por stdin, así que no hay archivo
+    intermedio ni una segunda codificación. Opcionalmente se multiplexa el
+    audio de otro archivo (audio_path) con los argumentos de audio indicados.
+    """
+
+    def __init__(self, output_path, width, height, fps, profile='visualization',
+                 audio_path=None, audio_args=None, input_pix_fmt='bgr24'):
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.frame_count = 0
+
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'rawvideo',
+            '-pix_fmt', input_pix_fmt,
+            '-s', f'{width}x{height}',
+            '-r', str(fps),
+            '-i', 'pipe:0'
+        ]
+        if audio_path:
+            cmd += ['-i', audio_path, '-map', '0:v', '-map', '1:a?']
+        cmd += build_codec_args(profile)
+        if audio_path:
+            cmd += list(audio_args or ['-c:a', 'copy']) + ['-shortest']
+        cmd += [output_path]
+
+        # stderr a un archivo temporal (como en iter_pcm_blocks): una tubería
+        # que nadie vacía mientras se escriben frames podría bloquear a ffmpeg
+        self.stderr_file = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=self.stderr_file)
+        self.failure_reported = False
+
+    def write(self, frame):
+        """Enviar un frame (array uint8 alto x ancho x canales)"""
+        if frame.shape[0] != self.height or frame.shape[1] != self.width:
+            raise ValueError(f"Frame de {frame.shape[1]}x{frame.shape[0]}, "
+                             f"se esperaba {self.width}x{self.height}")
+        try:
+            self.process.stdin.write(frame.data if frame.flags['C_CONTIGUOUS'] else frame.tobytes())
+        except BrokenPipeError:
+            # ffmpeg terminó antes de tiempo: el motivo real está en su stderr
+            self.process.wait()
+            self.failure_reported = True
+            raise RuntimeError(f"ffmpeg terminó al escribir {self.output_path}: "
+                               f"{read_log_tail(self.stderr_file)}") from None
+        self.frame_count += 1
+
+    def close(self):
+        """Cerrar la entrada y esperar a ffmpeg; devuelve True si terminó bien"""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self.process.wait()
+        stderr = read_log_tail(self.stderr_file)
+        self.stderr_file.close()
+
+        if returncode != 0:
+            logger.error(f"ffmpeg falló al escribir {self.output_path}: {stderr}")
+            return False
+        return True
+
+    def abort(self):
+        """Terminar el proceso sin finalizar el archivo (tras un error)"""
+        exited = self.process.poll() is not None
+        self.process.kill()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.wait()
+
+        # Si ffmpeg ya había fallado por su cuenta, registrar su diagnóstico
+        if exited and self.process.returncode != 0 and not self.failure_reported:
+            logger.error(f"ffmpeg falló al escribir {self.output_path}: {read_log_tail(self.stderr_file)}")
+        self.stderr_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.abort()
+        return False
+
+class FFmpegFrameReader:
+    """Fuente de frames decodificados por ffmpeg, con la interfaz de cv2.VideoCapture
+
+    A diferencia de OpenCV conserva el canal alfa: con pix_fmt='bgra' cada
+    frame es un array alto x ancho x 4.
+    """
+
+    def __init__(self, video_path, width, height, pix_fmt='bgra'):
+        self.video_path = video_path
+        self.channels = 4 if pix_fmt in ('bgra', 'rgba') else 3
+        self.shape = (height, width, self.channels)
+        self.frame_bytes = width * height * self.channels
+
+        cmd = [
+            'ffmpeg', '-v', 'error',
+            '-i', video_path,
+            '-f', 'rawvideo',
+            '-pix_fmt', pix_fmt,
+            'pipe:1'
+        ]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def isOpened(self):
+        return self.process.poll() is None or self.process.returncode == 0
+
+    def read(self):
+        """Siguiente frame como (True, frame) o (False, None) al terminar"""
+        data = self.process.stdout.read(self.frame_bytes)
+        if len(data) < self.frame_bytes:
+            return False, None
+        return True, np.frombuffer(data, dtype=np.uint8).reshape(self.shape)
+
+    def release(self):
+        """Cerrar la tubería y terminar ffmpeg si aún está decodificando"""
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.stdout.close()
+        self.process.wait()
@@ -0,0 +1,205 @@
+"""
+Canalización por etapas para componer video: decodificación → composición → codificación
+
+Cada fuente de frames se lee en su propio hilo, un grupo de hilos compone
+(OpenCV libera el GIL) y el hilo que llama codifica en orden. Las colas entre
+etapas son acotadas: si el codificador se retrasa, las etapas anteriores se
+bloquean en lugar de acumular frames en memoria.
+"""
+
+import os
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Marca de fin de flujo en las colas
+END = object()
+
+class PipelineStopped(Exception):
+    """La canalización se detuvo porque otra etapa falló"""
+
+class StageStats:
+    """Frames procesados y tiempo ocupado de una etapa"""
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.frames += 1
+            self.busy += seconds
+
+    def summary(self, elapsed):
+        fps = self.frames / self.busy if self.busy > 0 else 0.0
+        usage = self.busy / elapsed * 100 if elapsed > 0 else 0.0
+        return f"{self.name}: {self.frames} frames, {fps:.1f} fps, ocupada {usage:.0f}% del tiempo"
+
+class FramePipeline:
+    """Decodificación, composición y codificación solapadas con colas acotadas"""
+
+    def __init__(self, workers=None, queue_size=8):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.stop_event = threading.Event()
+        self.errors = []
+        self.stats = []
+
+    def put(self, q, item):
+        """Encolar esperando si la cola está llena (contrapresión) salvo que se detenga"""
+        while True:
+            if self.stop_event.is_set():
+                raise PipelineStopped()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(self, q):
+        """Desencolar esperando a que haya un elemento salvo que se detenga"""
+        while True:
+            if self.stop_event.is_set():
+                raise PipelineStopped()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def new_stats(self, name):
+        stats = StageStats(name)
+        self.stats.append(stats)
+        return stats
+
+    def start_stage(self, name, target, *args):
+        """Lanzar una etapa en un hilo; un error detiene toda la canalización"""
+        def run():
+            try:
+                target(*args)
+            except PipelineStopped:
+                pass
+            except Exception as e:
+                self.errors.append(e)
+                self.stop_event.set()
+
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def decode(self, frames, out_queue, stats):
+        """Etapa de decodificación: leer una fuente hasta agotarla"""
+        iterator = iter(frames)
+        while True:
+            start = time.perf_counter()
+            frame = next(iterator, END)
+            if frame is END:
+                break
+            stats.add(time.perf_counter() - start)
+            self.put(out_queue, frame)
+        self.put(out_queue, END)
+
+    def gather(self, source_queues, work_queue):
+        """Agrupar el frame k de cada fuente; la primera fuente marca la duración"""
+        base_queue, other_queues = source_queues[0], source_queues[1:]
+        finished = [False] * len(other_queues)
+        index = 0
+        while True:
+            base = self.get(base_queue)
+            if base is END:
+                break
+            others = []
+            for i, q in enumerate(other_queues):
+                frame = None if finished[i] else self.get(q)
+                if frame is END:
+                    finished[i] = True
+                    frame = None
+                others.append(frame)
+            self.put(work_queue, (index, base, others))
+            index += 1
+
+        # Las fuentes secundarias más largas que la base se descartan
+        for i, q in enumerate(other_queues):
+            while not finished[i]:
+                finished[i] = self.get(q) is END
+        for _ in range(self.workers):
+            self.put(work_queue, END)
+
+    def composite(self, work_queue, result_queue, composite, stats):
+        """Etapa de composición: un hilo del grupo de trabajadores"""
+        while True:
+            item = self.get(work_queue)
+            if item is END:
+                break
+            index, base, others = item
+            start = time.perf_counter()
+            frame = composite(base, others)
+            stats.add(time.perf_counter() - start)
+            self.put(result_queue, (index, frame))
+        self.put(result_queue, END)
+
+    def run(self, sources, composite, sink, source_names=None):
+        """Ejecutar la canalización; sink recibe los frames compuestos en orden
+
+        sources es una lista de iterables de frames (el primero es la base),
+        composite(base, otros) devuelve el frame final y se llama desde varios
+        hilos a la vez. Devuelve el número de frames entregados a sink.
+        """
+        source_names = source_names or [f"fuente {i}" for i in range(len(sources))]
+        source_queues = [queue.Queue(self.queue_size) for _ in sources]
+        work_queue = queue.Queue(self.queue_size)
+        result_queue = queue.Queue(self.queue_size)
+
+        composite_stats = self.new_stats(f"composición ({self.workers} hilos)")
+        encode_stats = StageStats("codificación")
+        started = time.perf_counter()
+
+        threads = []
+        for frames, q, name in zip(sources, source_queues, source_names):
+            threads.append(self.start_stage(f"decode-{name}", self.decode, frames, q,
+                                            self.new_stats(f"decodificación {name}")))
+        threads.append(self.start_stage("gather", self.gather, source_queues, work_queue))
+        for i in range(self.workers):
+            threads.append(self.start_stage(f"composite-{i}", self.composite, work_queue,
+                                            result_queue, composite, composite_stats))
+        self.stats.append(encode_stats)
+
+        # Codificación en este hilo, en orden: los trabajadores terminan desordenados
+        pending = {}
+        next_index = 0
+        finished_workers = 0
+        try:
+            while finished_workers < self.workers:
+                item = self.get(result_queue)
+                if item is END:
+                    finished_workers += 1
+                    continue
+                pending[item[0]] = item[1]
+                while next_index in pending:
+                    start = time.perf_counter()
+                    sink(pending.pop(next_index))
+                    encode_stats.add(time.perf_counter() - start)
+                    next_index += 1
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            if self.errors:
+                # Desbloquear las etapas que esperan en colas llenas o vacías
+                self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Canalización: {next_index} frames en {elapsed:.1f}s ({next_index / max(elapsed, 1e-9):.1f} fps)")
+        for stats in self.stats:
+            logger.info(f"  {stats.summary(elapsed)}")
+        return next_index
@@ -0,0 +1,161 @@
+"""
+Índice persistente de la biblioteca musical con detección de cambios
+"""
+
+import os
+import sys
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from config import MUSICA_DIR, CACHE_CONFIG, PROCESS_CONFIG
+from utils import (
+    load_json_file, save_json_file, calculate_file_hash, get_audio_info, format_time
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+class LibraryIndex:
+    """Índice de archivos de audio (ruta, tamaño, mtime, huella, duración y códec)
+
+    El índice se guarda en JSON. Cada escaneo recorre los directorios con
+    os.scandir y solo vuelve a analizar los archivos nuevos o modificados.
+    """
+
+    def __init__(self, index_path=None):
+        self.index_path = index_path or CACHE_CONFIG['library_index']
+        self.supported_formats = PROCESS_CONFIG['supported_formats']
+        self.max_workers = PROCESS_CONFIG['max_concurrent_processes']
+
+        data = load_json_file(self.index_path, default={})
+        if data.get('version') != INDEX_VERSION:
+            data = {'version': INDEX_VERSION, 'entries': {}}
+        self.entries = data['entries']
+        self.dirty = False
+        self.scanned = {}
+
+    def _walk(self, directory):
+        """Recorrer un directorio recursivamente devolviendo (ruta, stat) de cada audio"""
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as iterator:
+                    for entry in iterator:
+                        if entry.is_dir(follow_symlinks=True):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=True) and \
+                                entry.name.lower().endswith(tuple(self.supported_formats)):
+                            yield os.path.abspath(entry.path), entry.stat()
+            except OSError as e:
+                logger.warning(f"No se pudo leer el directorio {current}: {e}")
+
+    def _is_current(self, path, stat):
+        """Indica si la entrada del índice coincide con el archivo en disco"""
+        entry = self.entries.get(path)
+        return entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns
+
+    def _probe(self, path, stat):
+        """Analizar un archivo: huella de contenido y metadatos del contenedor"""
+        info = get_audio_info(path)
+        return {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'fingerprint': calculate_file_hash(path),
+            'duration': info['duration'] if info and info['duration'] > 0 else None,
+            'codec': info['codec'] if info else None,
+            'sample_rate': info['sample_rate'] if info else None,
+            'channels': info['channels'] if info else None
+        }
+
+    def _refresh(self, items):
+        """Volver a analizar en paralelo los archivos nuevos o modificados"""
+        if not items:
+            return
+
+        max_workers = max(1, min(self.max_workers, len(items)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            probed = executor.map(lambda item: self._probe(*item), items)
+            for (path, _), entry in zip(items, probed):
+                self.entries[path] = entry
+
+        self.dirty = True
+
+    def scan(self, directory=None):
+        """Escanear un directorio y devolver sus archivos de audio ordenados
+
+        El resultado se memoriza durante la vida del índice, de modo que las
+        etapas del proceso comparten un único escaneo.
+        """
+        directory = os.path.abspath(directory or MUSICA_DIR)
+        if directory in self.scanned:
+            return list(self.scanned[directory])
+
+        if not os.path.isdir(directory):
+            logger.error(f"La carpeta {directory} no existe")
+            return []
+
+        found = dict(self._walk(directory))
+        changed = [(path, stat) for path, stat in found.items() if not self._is_current(path, stat)]
+        self._refresh(changed)
+
+        # Eliminar del índice los archivos que ya no están en el directorio
+        prefix = directory + os.sep
+        removed = [path for path in self.entries if path.startswith(prefix) and path not in found]
+        for path in removed:
+            del self.entries[path]
+        if removed:
+            self.dirty = True
+
+        logger.info(f"Biblioteca {directory}: {len(found)} archivos "
+                    f"({len(changed)} nuevos o modificados, {len(removed)} eliminados)")
+
+        # Ordenar por ruta relativa para consistencia
+        files = sorted(found, key=lambda path: os.path.relpath(path, directory).lower())
+        self.scanned[directory] = files
+        self.save()
+        return list(files)
+
+    def get_entry(self, file_path):
+        """Entrada actualizada de un archivo (lo indexa si es nuevo o cambió)"""
+        path = os.path.abspath(file_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        if not self._is_current(path, stat):
+            self._refresh([(path, stat)])
+        return self.entries[path]
+
+    def get_duration(self, file_path):
+        """Duración según los metadatos indexados, o None si no la tienen"""
+        entry = self.get_entry(file_path)
+        return entry['duration'] if entry else None
+
+    def set_duration(self, file_path, duration):
+        """Guardar una duración obtenida por decodificación exacta"""
+        entry = self.get_entry(file_path)
+        if entry is not None:
+            entry['duration'] = duration
+            self.dirty = True
+
+    def get_fingerprint(self, file_path):
+        """Huella de contenido indexada del archivo"""
+        entry = self.get_entry(file_path)
+        return entry['fingerprint'] if entry else None
+
+    def save(self):
+        """Escribir el índice en disco si hubo cambios"""
+        if self.dirty and save_json_file(self.index_path, {'version': INDEX_VERSION, 'entries': self.entries}):
+            self.dirty = False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    index = LibraryIndex()
+    music_dir = sys.argv[1] if len(sys.argv) > 1 else MUSICA_DIR
+
+    for path in index.scan(music_dir):
+        entry = index.entries[path]
+        duration = format_time(entry['duration']) if entry['duration'] else '--:--'
+        print(f"{duration}  {entry['codec'] or '?':6}  {os.path.relpath(path, music_dir)}")
@@ -0,0 +1,203 @@
+"""
+Análisis de sonoridad (ITU-R BS.1770) por streaming con NumPy
+"""
+
+import math
+import logging
+import numpy as np
+from scipy import signal
+
+logger = logging.getLogger(__name__)
+
+# Parámetros de los filtros de ponderación K (estante agudo + pasa altos), los
+# mismos que libebur128 usa para recalcular los coeficientes de BS.1770 a
+# cualquier frecuencia de muestreo
+SHELF_GAIN_DB = 3.999843853973347
+SHELF_Q = 0.7071752369554196
+SHELF_FREQ = 1681.974450955533
+SHELF_VB_EXPONENT = 0.4996667741545416
+HIGHPASS_Q = 0.5003270373238773
+HIGHPASS_FREQ = 38.13547087602444
+
+# Gating según BS.1770-4
+BLOCK_SECONDS = 0.4
+STEP_SECONDS = 0.1
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+# Versión del análisis: forma parte de la clave de la caché de audio, que guarda
+# la ganancia calculada (2: ponderación K de libebur128 y pico verdadero polifásico)
+LOUDNESS_VERSION = 2
+
+# Sobremuestreo para estimar el pico verdadero
+TRUE_PEAK_OVERSAMPLING = 4
+TRUE_PEAK_HALF_TAPS = 10  # Coeficientes por lado y por fase del FIR de interpolación
+
+def k_weighting_sos(sample_rate):
+    """Secciones de segundo orden del filtro de ponderación K para una frecuencia de muestreo
+
+    Transformada bilineal con prewarping (K = tan(pi * f0 / fs)) como en
+    libebur128: a 48 kHz reproduce los coeficientes de referencia de BS.1770.
+    """
+    # Estante agudo
+    K = math.tan(math.pi * SHELF_FREQ / sample_rate)
+    Vh = 10 ** (SHELF_GAIN_DB / 20.0)
+    Vb = Vh ** SHELF_VB_EXPONENT
+    a0 = 1.0 + K / SHELF_Q + K * K
+    shelf_b = [
+        (Vh + Vb * K / SHELF_Q + K * K) / a0,
+        2.0 * (K * K - Vh) / a0,
+        (Vh - Vb * K / SHELF_Q + K * K) / a0
+    ]
+    shelf_a = [1.0, 2.0 * (K * K - 1.0) / a0, (1.0 - K / SHELF_Q + K * K) / a0]
+
+    # Pasa altos (RLB), con ganancia unitaria en la banda de paso como en BS.1770
+    K = math.tan(math.pi * HIGHPASS_FREQ / sample_rate)
+    a0 = 1.0 + K / HIGHPASS_Q + K * K
+    highpass_b = [1.0, -2.0, 1.0]
+    highpass_a = [1.0, 2.0 * (K * K - 1.0) / a0, (1.0 - K / HIGHPASS_Q + K * K) / a0]
+
+    return np.array([shelf_b + shelf_a, highpass_b + highpass_a])
+
+def true_peak_phases(oversampling=TRUE_PEAK_OVERSAMPLING):
+    """FIR de interpolación separado por fases (fases x coeficientes por fase)
+
+    Es el mismo diseño que usa signal.resample_poly (ventana de Kaiser,
+    beta 5), pero aplicado como filtro polifásico con estado: cada fase da
+    una de las muestras intermedias y el resultado no depende de cómo se
+    divida la señal en bloques.
+    """
+    num_taps = 2 * TRUE_PEAK_HALF_TAPS * oversampling + 1
+    taps = signal.firwin(num_taps, 1.0 / oversampling, window=('kaiser', 5.0)) * oversampling
+    taps = np.concatenate([taps, np.zeros(-num_taps % oversampling)])
+    return taps.reshape(-1, oversampling).T
+
+class LoudnessMeter:
+    """Medidor de sonoridad integrada y pico verdadero alimentado por bloques
+
+    Recibe bloques PCM int16 intercalados y mantiene el estado de los filtros
+    entre bloques, de modo que una sola pasada sobre la pista basta.
+    """
+
+    def __init__(self, sample_rate, channels):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sos = k_weighting_sos(sample_rate)
+        # Estado de sosfilt con axis=0: (secciones, 2, canales)
+        self.zi = np.zeros((self.sos.shape[0], 2, channels))
+
+        # Energía acumulada por segmentos de 100 ms (4 segmentos = bloque de 400 ms)
+        self.step_samples = int(round(STEP_SECONDS * sample_rate))
+        self.steps_per_block = int(round(BLOCK_SECONDS / STEP_SECONDS))
+        self.partial_energy = 0.0
+        self.partial_count = 0
+        self.step_energies = []
+
+        self.sample_peak = 0.0
+        self.true_peak = 0.0
+        self.peak_phases = true_peak_phases()
+        self.peak_zi = np.zeros((self.peak_phases.shape[0], self.peak_phases.shape[1] - 1, channels))
+
+    def add_chunk(self, chunk):
+        """Analizar un bloque PCM int16 intercalado"""
+        if chunk.size == 0:
+            return
+
+        samples = chunk.reshape(-1, self.channels).astype(np.float32) / 32768.0
+        self._update_peaks(samples)
+
+        weighted, self.zi = signal.sosfilt(self.sos, samples, axis=0, zi=self.zi)
+        # Suma de canales (peso 1.0 para L/R) de la energía por muestra
+        energy = np.sum(weighted * weighted, axis=1)
+        self._accumulate(energy)
+
+    def _update_peaks(self, samples):
+        """Actualizar pico de muestra y pico verdadero (sobremuestreo x4)"""
+        self.sample_peak = max(self.sample_peak, float(np.max(np.abs(samples))))
+
+        # Cada fase arrastra su historia entre bloques: las uniones no añaden bordes
+        for phase, taps in enumerate(self.peak_phases):
+            interpolated, self.peak_zi[phase] = signal.lfilter(taps, [1.0], samples, axis=0,
+                                                               zi=self.peak_zi[phase])
+            self.true_peak = max(self.true_peak, float(np.max(np.abs(interpolated))))
+
+    def _accumulate(self, energy):
+        """Repartir la energía en segmentos de 100 ms"""
+        position = 0
+        total = len(energy)
+
+        # Completar el segmento pendiente del bloque anterior
+        if self.partial_count:
+            needed = self.step_samples - self.partial_count
+            taken = energy[:needed]
+            self.partial_energy += float(np.sum(taken))
+            self.partial_count += len(taken)
+            position = len(taken)
+            if self.partial_count < self.step_samples:
+                return
+            self.step_energies.append(self.partial_energy)
+            self.partial_energy = 0.0
+            self.partial_count = 0
+
+        full_steps = (total - position) // self.step_samples
+        if full_steps:
+            end = position + full_steps * self.step_samples
+            sums = energy[position:end].reshape(full_steps, self.step_samples).sum(axis=1)
+            self.step_energies.extend(sums.tolist())
+            position = end
+
+        if position < total:
+            self.partial_energy = float(np.sum(energy[position:]))
+            self.partial_count = total - position
+
+    def integrated_loudness(self):
+        """Sonoridad integrada en LUFS (con gating absoluto y relativo)"""
+        steps = np.asarray(self.step_energies, dtype=np.float64)
+        if len(steps) < self.steps_per_block:
+            return float('-inf')
+
+        # Energía media de cada bloque de 400 ms con paso de 100 ms
+        window = np.ones(self.steps_per_block)
+        block_power = np.convolve(steps, window, mode='valid') / (self.step_samples * self.steps_per_block)
+        with np.errstate(divide='ignore'):
+            block_loudness = -0.691 + 10.0 * np.log10(block_power)
+
+        gated = block_power[block_loudness > ABSOLUTE_GATE_LUFS]
+        if gated.size == 0:
+            return float('-inf')
+
+        relative_gate = -0.691 + 10.0 * np.log10(np.mean(gated)) + RELATIVE_GATE_LU
+        gated = block_power[(block_loudness > ABSOLUTE_GATE_LUFS) & (block_loudness > relative_gate)]
+        if gated.size == 0:
+            return float('-inf')
+
+        return float(-0.691 + 10.0 * np.log10(np.mean(gated)))
+
+    def result(self):
+        """Resumen del análisis: sonoridad integrada y picos en dBFS"""
+        def to_db(value):
+            return 20.0 * math.log10(value) if value > 0 else float('-inf')
+
+        return {
+            'integrated_lufs': self.integrated_loudness(),
+            'sample_peak_db': to_db(self.sample_peak),
+            'true_peak_db': to_db(max(self.true_peak, self.sample_peak))
+        }
+
+def loudness_gain(analysis, target_lufs, true_peak_ceiling_db):
+    """Ganancia lineal para llevar una pista a la sonoridad objetivo sin superar el techo de pico"""
+    integrated = analysis['integrated_lufs']
+    if not math.isfinite(integrated):
+        return 1.0
+
+    gain_db = target_lufs - integrated
+    if math.isfinite(analysis['true_peak_db']):
+        gain_db = min(gain_db, true_peak_ceiling_db - analysis['true_peak_db'])
+    return 10 ** (gain_db / 20.0)
+
+def peak_gain(analysis, headroom_db):
+    """Ganancia lineal equivalente a AudioSegment.normalize() (pico a -headroom dB)"""
+    peak_db = analysis['sample_peak_db']
+    if not math.isfinite(peak_db):
+        return 1.0
+    return 10 ** ((-headroom_db - peak_db) / 20.0)
@@ -9,11 +9,13 @@ import logging
 import argparse
 from datetime import datetime
 import multiprocessing as mp
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 # Importar módulos del proyecto
 from audio_processor import AudioProcessor
-from visualizer_transparent import AudioVisualizer
+from visualizer_transparent import AudioVisualizer, init_render_worker, analyze_job, render_job
 from video_generator import VideoGenerator
 from config import (
     MUSICA_DIR, RECURSOS_DIR, TEMP_DIR, OUTPUT_DIR, 
@@ -34,7 +36,7 @@ logger = logging.getLogger(__name__)
 class MusicVideoGenerator:
     def __init__(self):
         self.audio_processor = AudioProcessor()
-        self.visualizer = AudioVisualizer()
+        self.visualizer = AudioVisualizer(library=self.audio_processor.library)
         self.video_generator = VideoGenerator()
         self.visualization_videos = []
         
@@ -72,25 +74,29 @@ class MusicVideoGenerator:
             return False
     
     def process_audio(self):
-        """Procesar audio y generar descripción"""
+        """Procesar audio y generar descripción
+        
+        Devuelve también las muestras de cada pista de la lista en el audio
+        combinado, que marcan dónde empieza cada visualización.
+        """
         try:
             logger.info("=== PROCESANDO AUDIO ===")
             
             # Procesar audio
-            audio_path, desc_path = self.audio_processor.process_audio()
+            audio_path, desc_path, track_samples = self.audio_processor.process_audio()
             
             if not audio_path:
                 logger.error("Error al procesar audio")
-                return None, None
+                return None, None, None
             
             logger.info(f"Audio procesado: {audio_path}")
             logger.info(f"Descripción generada: {desc_path}")
             
-            return audio_path, desc_path
+            return audio_path, desc_path, track_samples
             
         except Exception as e:
             logger.error(f"Error al procesar audio: {e}")
-            return None, None
+            return None, None, None
     
     def generate_visualizations(self, audio_files):
         """Generar visualizaciones para cada archivo de audio"""
@@ -101,61 +107,186 @@ class MusicVideoGenerator:
                 logger.warning("No hay archivos de audio para visualizar")
                 return []
             
-            # Crear lista de archivos repetida según configuración
-            playlist = audio_files * PROCESS_CONFIG['repeat_count']
-            
-            visualization_results = []
+            # Crear lista repetida y renderizar cada pista distinta una sola vez
+            playlist = self.audio_processor.build_playlist(audio_files)
+            unique_tracks = self.audio_processor.get_unique_tracks(playlist)
             
-            # Configurar procesamiento paralelo
-            max_workers = min(PROCESS_CONFIG['max_concurrent_processes'], len(playlist))
+            outputs = []
+            for i, audio_file in enumerate(unique_tracks):
+                # Crear nombre de archivo de salida
+                base_name = os.path.splitext(os.path.basename(audio_file))[0]
+                outputs.append(os.path.join(TEMP_DIR, f"viz_{i:03d}_{base_name}{self.visualizer.get_output_extension()}"))
             
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # Enviar tareas
-                future_to_audio = {}
-                
-                for i, audio_file in enumerate(playlist):
-                    # Crear nombre de archivo de salida
-                    base_name = os.path.splitext(os.path.basename(audio_file))[0]
-                    output_file = os.path.join(TEMP_DIR, f"viz_{i:03d}_{base_name}.mp4")
-                    
-                    # Enviar tarea
-                    future = executor.submit(
-                        self.visualizer.generate_visualization,
-                        audio_file,
-                        output_file
-                    )
-                    future_to_audio[future] = (audio_file, output_file)
-                
-                # Recopilar resultados
-                for future in as_completed(future_to_audio):
-                    audio_file, output_file = future_to_audio[future]
-                    try:
-                        success = future.result()
-                        visualization_results.append((audio_file, output_file, success))
-                        
-                        if success:
-                            logger.info(f"Visualización completada: {os.path.basename(output_file)}")
-                        else:
-                            logger.error(f"Error en visualización: {os.path.basename(audio_file)}")
-                            
-                    except Exception as e:
-                        logger.error(f"Error al generar visualización para {audio_file}: {e}")
-                        visualization_results.append((audio_file, output_file, False))
+            if PROCESS_CONFIG['visualization_executor'] == 'process':
+                rendered = self.render_visualizations_in_processes(unique_tracks, outputs)
+            else:
+                rendered = self.render_visualizations_in_threads(unique_tracks, outputs)
             
-            # Filtrar visualizaciones exitosas
-            successful_visualizations = [
-                result[1] for result in visualization_results if result[2]
-            ]
+            # Las repeticiones reutilizan la visualización ya renderizada, en orden
+            # de lista; las pistas que fallaron quedan como None para no desplazar
+            # la línea de tiempo
+            visualization_videos = [rendered.get(audio_file) for audio_file in playlist]
             
-            logger.info(f"Visualizaciones generadas exitosamente: {len(successful_visualizations)}")
-            return successful_visualizations
+            logger.info(f"Visualizaciones renderizadas: {len(rendered)} únicas, "
+                        f"{sum(1 for viz in visualization_videos if viz)} de {len(playlist)} en la lista")
+            return visualization_videos
             
         except Exception as e:
             logger.error(f"Error al generar visualizaciones: {e}")
             return []
     
-    def generate_final_video(self, audio_path, visualization_videos):
-        """Generar video final"""
+    def render_visualizations_in_threads(self, unique_tracks, outputs):
+        """Renderizar visualizaciones con un pool de hilos (una instancia compartida)"""
+        rendered = {}
+        
+        # Configurar procesamiento paralelo
+        max_workers = min(PROCESS_CONFIG['max_concurrent_processes'], len(unique_tracks))
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Enviar tareas
+            future_to_audio = {
+                executor.submit(self.visualizer.generate_visualization, audio_file, output_file): (audio_file, output_file)
+                for audio_file, output_file in zip(unique_tracks, outputs)
+            }
+            
+            # Recopilar resultados
+            for future in as_completed(future_to_audio):
+                audio_file, output_file = future_to_audio[future]
+                try:
+                    if future.result():
+                        rendered[audio_file] = output_file
+                        logger.info(f"Visualización completada: {os.path.basename(output_file)}")
+                    else:
+                        logger.error(f"Error en visualización: {os.path.basename(audio_file)}")
+                        
+                except Exception as e:
+                    logger.error(f"Error al generar visualización para {audio_file}: {e}")
+        
+        return rendered
+    
+    def render_visualizations_in_processes(self, unique_tracks, outputs):
+        """Renderizar visualizaciones con un pool de procesos
+        
+        Cada worker crea su propio visualizador una sola vez y recibe trabajos
+        serializables; la caché de espectrogramas solo se modifica aquí, en el
+        proceso principal. Primero se calculan los espectrogramas que faltan y
+        luego cada pista se divide en fragmentos de tiempo que se renderizan en
+        paralelo y se unen sin recodificar. El progreso llega por una cola.
+        """
+        rendered = {}
+        jobs = [
+            self.visualizer.make_render_job(i, audio_file, output_file)
+            for i, (audio_file, output_file) in enumerate(zip(unique_tracks, outputs))
+        ]
+        
+        max_workers = PROCESS_CONFIG['max_concurrent_processes']
+        shard_frames = int(PROCESS_CONFIG['visualization_shard_seconds'] * self.visualizer.fps)
+        
+        # 'spawn' evita que los workers hereden por fork las tuberías de otros procesos ffmpeg
+        context = mp.get_context('spawn')
+        progress_queue = context.Queue()
+        
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                                     initializer=init_render_worker,
+                                     initargs=(self.visualizer.get_worker_config(), progress_queue)) as executor:
+                # 1. Espectrogramas que no están en caché
+                self.analyze_jobs(executor, jobs, max_workers)
+                
+                # 2. Render por fragmentos de tiempo de todas las pistas analizadas
+                shards = {}
+                for job in jobs:
+                    if job['features_path'] is not None:
+                        num_frames = np.load(job['features_path'], mmap_mode='r').shape[1]
+                        shards[job['audio_path']] = self.visualizer.split_render_job(job, num_frames, shard_frames)
+                
+                shard_jobs = [shard for track_shards in shards.values() for shard in track_shards]
+                logger.info(f"Renderizando {len(shards)} visualizaciones en {len(shard_jobs)} fragmentos "
+                            f"con {max_workers} procesos")
+                
+                future_to_shard = {executor.submit(render_job, shard): shard for shard in shard_jobs}
+                remaining = {audio_file: len(track_shards) for audio_file, track_shards in shards.items()}
+                failed = set()
+                progress = {}
+                pending = set(future_to_shard)
+                
+                while pending:
+                    done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                    
+                    # Progreso agregado de todos los workers
+                    reported = False
+                    while True:
+                        try:
+                            shard_path, frame, total = progress_queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        progress[shard_path] = (frame, total)
+                        reported = True
+                    if reported:
+                        frames_done = sum(frame for frame, _ in progress.values())
+                        frames_total = sum(shard['frame_end'] - shard['frame_start'] for shard in shard_jobs)
+                        logger.info(f"Visualizaciones: {frames_done}/{frames_total} frames "
+                                    f"({len(progress)}/{len(shard_jobs)} fragmentos iniciados)")
+                    
+                    for future in done:
+                        shard = future_to_shard[future]
+                        result = future.result()
+                        audio_file = shard['audio_path']
+                        if not result['success']:
+                            failed.add(audio_file)
+                            logger.error(f"Error en visualización: {os.path.basename(audio_file)}"
+                                         f"{': ' + result['error'] if result.get('error') else ''}")
+                        
+                        remaining[audio_file] -= 1
+                        if remaining[audio_file] > 0:
+                            continue
+                        
+                        # Todos los fragmentos de la pista terminaron: unirlos
+                        job = jobs[shard['index']]
+                        shard_paths = [s['output_path'] for s in shards[audio_file]]
+                        if audio_file not in failed and self.visualizer.join_shards(shard_paths, job['output_path']):
+                            rendered[audio_file] = job['output_path']
+                            logger.info(f"Visualización completada: {os.path.basename(job['output_path'])} "
+                                        f"({len(shard_paths)} fragmentos)")
+                        else:
+                            for path in shard_paths:
+                                if os.path.exists(path):
+                                    os.remove(path)
+        
+        finally:
+            self.remove_temp_features(jobs)
+        
+        return rendered
+    
+    def analyze_jobs(self, executor, jobs, max_workers):
+        """Calcular en el pool los espectrogramas de los trabajos que no están en caché
+        
+        Al terminar, job['features_path'] apunta al espectrograma de cada pista
+        analizada; las que fallaron quedan en None.
+        """
+        pending_analysis = [job for job in jobs if job['features_path'] is None]
+        if pending_analysis:
+            logger.info(f"Analizando {len(pending_analysis)} pistas con {max_workers} procesos")
+        future_to_job = {executor.submit(analyze_job, job): job for job in pending_analysis}
+        for future in as_completed(future_to_job):
+            job = future_to_job[future]
+            result = future.result()
+            self.visualizer.store_job_features(job, result)
+            if not result['success']:
+                logger.error(f"Error al analizar {os.path.basename(job['audio_path'])}: {result['error']}")
+    
+    def remove_temp_features(self, jobs):
+        """Borrar los espectrogramas temporales de los trabajos (caché desactivada)"""
+        for job in jobs:
+            if job['features_output'] and os.path.exists(job['features_output']):
+                os.remove(job['features_output'])
+    
+    def generate_final_video(self, audio_path, visualization_videos, track_samples):
+        """Generar video final
+        
+        Cada visualización ocupa exactamente las muestras de su pista en el
+        audio combinado (track_samples), no la duración de los metadatos.
+        """
         try:
             logger.info("=== GENERANDO VIDEO FINAL ===")
             
@@ -163,12 +294,17 @@ class MusicVideoGenerator:
             background_image_path = FILES_CONFIG['background_image']
             output_path = FILES_CONFIG['final_video']
             
+            # Cada visualización ocupa el tramo de su pista en el audio combinado
+            durations = self.audio_processor.get_track_durations(track_samples)
+            
             # Generar video final
             success = self.video_generator.generate_final_video(
                 audio_path,
                 background_image_path,
                 visualization_videos,
-                output_path
+                output_path,
+                placement=self.visualizer.get_placement(),
+                durations=durations
             )
             
             if success:
@@ -182,6 +318,59 @@ class MusicVideoGenerator:
             logger.error(f"Error al generar video final: {e}")
             return None
     
+    def generate_fused_video(self, audio_path, audio_files, track_samples):
+        """Generar el video final en una sola pasada, sin archivos intermedios
+        
+        Los espectrogramas de cada pista distinta se calculan antes, en el pool
+        de procesos (o se toman de la caché); luego las barras se pintan sobre
+        una copia en memoria de la imagen de fondo y cada frame va directo al
+        codificador junto con el audio combinado. Cada pista dura exactamente
+        las muestras que ocupa en el audio combinado (track_samples), y las
+        que no se pudieron analizar se muestran solo con el fondo.
+        """
+        jobs = []
+        try:
+            logger.info("=== GENERANDO VIDEO FINAL (MODO FUSIONADO) ===")
+            
+            output_path = FILES_CONFIG['final_video']
+            playlist = self.audio_processor.build_playlist(audio_files)
+            unique_tracks = self.audio_processor.get_unique_tracks(playlist)
+            durations = self.audio_processor.get_track_durations(track_samples)
+            
+            # Analizar cada pista distinta una sola vez, antes de abrir el codificador
+            jobs = [self.visualizer.make_render_job(i, audio_file, None) for i, audio_file in enumerate(unique_tracks)]
+            pending_analysis = [job for job in jobs if job['features_path'] is None]
+            if pending_analysis:
+                max_workers = max(1, min(PROCESS_CONFIG['max_concurrent_processes'], len(pending_analysis)))
+                # 'spawn' evita que los workers hereden por fork las tuberías de otros procesos ffmpeg
+                with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context('spawn'),
+                                         initializer=init_render_worker,
+                                         initargs=(self.visualizer.get_worker_config(),)) as executor:
+                    self.analyze_jobs(executor, pending_analysis, max_workers)
+            
+            features = {job['audio_path']: job['features_path'] for job in jobs}
+            failed = [audio_file for audio_file, path in features.items() if path is None]
+            if failed:
+                logger.warning(f"{len(failed)} pistas sin espectrograma se mostrarán solo con el fondo: "
+                               f"{', '.join(os.path.basename(audio_file) for audio_file in failed)}")
+            
+            background = self.video_generator.load_background_image(FILES_CONFIG['background_image'])
+            frames = self.visualizer.render_playlist(background, playlist, durations, features)
+            
+            if self.video_generator.encode_frames(frames, audio_path, output_path):
+                logger.info(f"Video final generado exitosamente: {output_path}")
+                return output_path
+            
+            logger.error("Error al generar video final")
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error al generar video final: {e}")
+            return None
+        
+        finally:
+            self.remove_temp_features(jobs)
+    
     def cleanup(self):
         """Limpiar archivos temporales"""
         try:
@@ -208,17 +397,22 @@ class MusicVideoGenerator:
                 return False
             
             # 3. Procesar audio
-            audio_path, desc_path = self.process_audio()
+            audio_path, desc_path, track_samples = self.process_audio()
             if not audio_path:
                 logger.error("Error al procesar audio")
                 return False
             
-            # 4. Generar visualizaciones
             audio_files = self.audio_processor.get_audio_files()
-            visualization_videos = self.generate_visualizations(audio_files)
-            
-            # 5. Generar video final
-            final_video_path = self.generate_final_video(audio_path, visualization_videos)
+            if PROCESS_CONFIG['render_mode'] == 'fused':
+                # 4-5. Visualización y video final en una sola pasada
+                visualization_videos = []
+                final_video_path = self.generate_fused_video(audio_path, audio_files, track_samples)
+            else:
+                # 4. Generar visualizaciones
+                visualization_videos = self.generate_visualizations(audio_files)
+                
+                # 5. Generar video final
+                final_video_path = self.generate_final_video(audio_path, visualization_videos, track_samples)
             if not final_video_path:
                 logger.error("Error al generar video final")
                 return False
@@ -235,7 +429,7 @@ class MusicVideoGenerator:
             logger.info(f"Video final: {final_video_path}")
             logger.info(f"Descripción: {desc_path}")
             logger.info(f"Canciones procesadas: {len(audio_files)}")
-            logger.info(f"Visualizaciones generadas: {len(visualization_videos)}")
+            logger.info(f"Visualizaciones generadas: {sum(1 for viz in visualization_videos if viz)}")
             
             return True
             
@@ -256,6 +450,10 @@ def main():
                        help='No limpiar archivos temporales')
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='Modo verbose')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Reutilizar los segmentos de audio de la construcción anterior')
+    parser.add_argument('--render-mode', choices=['fused', 'composite'], default=None,
+                       help='fused: una sola pasada sin intermedios; composite: visualizaciones y video base')
     
     args = parser.parse_args()
     
@@ -280,6 +478,14 @@ def main():
         import config
         config.PROCESS_CONFIG['temp_cleanup'] = False
     
+    if args.incremental:
+        import config
+        config.AUDIO_CONFIG['incremental'] = True
+    
+    if args.render_mode:
+        import config
+        config.PROCESS_CONFIG['render_mode'] = args.render_mode
+    
     # Crear y ejecutar generador
     generator = MusicVideoGenerator()
     success = generator.run()
@@ -76,7 +76,7 @@ class OptimizedMusicVideoGenerator:
             logger.info("=== PROCESANDO AUDIO ===")
             
             # Procesar audio
-            audio_path, desc_path = self.audio_processor.process_audio()
+            audio_path, desc_path, _ = self.audio_processor.process_audio()
             
             if not audio_path:
                 logger.error("Error al procesar audio")
@@ -201,6 +201,8 @@ def main():
                        help='No limpiar archivos temporales')
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='Modo verbose')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Reutilizar los segmentos de audio de la construcción anterior')
     parser.add_argument('--gpu', action='store_true',
                        help='Forzar uso de GPU')
     
@@ -227,6 +229,10 @@ def main():
         import config
         config.PROCESS_CONFIG['temp_cleanup'] = False
     
+    if args.incremental:
+        import config
+        config.AUDIO_CONFIG['incremental'] = True
+    
     # Crear y ejecutar generador
     generator = OptimizedMusicVideoGenerator()
     success = generator.run()
@@ -0,0 +1,157 @@
+"""
+Análisis de mel con NumPy: plan reutilizable entre pistas (ventana y banco de mel)
+
+Implementa lo mismo que librosa.feature.melspectrogram con sus valores por
+defecto (ventana Hann periódica, center=True con relleno de ceros, banco de
+filtros de Slaney normalizado por área) sin importar librosa, que tarda
+segundos en cargar y compilar con numba la primera vez. librosa queda como
+alternativa opcional con backend='librosa'.
+"""
+
+import logging
+import threading
+import numpy as np
+
+try:
+    # pocketfft de SciPy trabaja en float32 nativo y es varias veces más rápido
+    import scipy.fft as fft_backend
+except ImportError:
+    fft_backend = np.fft
+
+logger = logging.getLogger(__name__)
+
+# Frames por lote de FFT: acota la memoria intermedia (n_fft x lote)
+FFT_BATCH_FRAMES = 1024
+
+def hann_window(n_fft):
+    """Ventana Hann periódica (como scipy.signal.get_window('hann', n, fftbins=True))"""
+    n = np.arange(n_fft)
+    return (0.5 - 0.5 * np.cos(2.0 * np.pi * n / n_fft)).astype(np.float32)
+
+def hz_to_mel(frequencies):
+    """Escala de mel de Slaney: lineal hasta 1 kHz y logarítmica por encima"""
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    f_sp = 200.0 / 3
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    log_mels = min_log_mel + np.log(np.maximum(frequencies, min_log_hz) / min_log_hz) / logstep
+    return np.where(frequencies >= min_log_hz, log_mels, frequencies / f_sp)
+
+def mel_to_hz(mels):
+    """Inversa de hz_to_mel"""
+    mels = np.asarray(mels, dtype=np.float64)
+    f_sp = 200.0 / 3
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    log_frequencies = min_log_hz * np.exp(logstep * (np.maximum(mels, min_log_mel) - min_log_mel))
+    return np.where(mels >= min_log_mel, log_frequencies, f_sp * mels)
+
+def mel_filterbank(sample_rate, n_fft, n_mels, fmin=0.0, fmax=None):
+    """Banco de filtros triangulares de mel (n_mels x (1 + n_fft // 2)), normalizado por área"""
+    if fmax is None:
+        fmax = sample_rate / 2.0
+    fft_freqs = np.fft.rfftfreq(n_fft, d=1.0 / sample_rate)
+    mel_freqs = mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2))
+
+    fdiff = np.diff(mel_freqs)
+    ramps = mel_freqs[:, None] - fft_freqs[None, :]
+    lower = -ramps[:-2] / fdiff[:-1, None]
+    upper = ramps[2:] / fdiff[1:, None]
+    weights = np.maximum(0, np.minimum(lower, upper))
+
+    # Normalización de Slaney: cada triángulo tiene área aproximadamente constante
+    enorm = 2.0 / (mel_freqs[2:n_mels + 2] - mel_freqs[:n_mels])
+    weights *= enorm[:, None]
+    return weights.astype(np.float32)
+
+def frame_signal(samples, frame_length, hop_length):
+    """Vista (frames x frame_length) de la señal, sin copiar muestras"""
+    num_frames = 1 + (len(samples) - frame_length) // hop_length
+    stride = samples.strides[0]
+    return np.lib.stride_tricks.as_strided(samples, shape=(num_frames, frame_length),
+                                           strides=(hop_length * stride, stride), writeable=False)
+
+class AnalysisPlan:
+    """Parámetros y tablas precalculadas de un espectrograma de mel
+
+    La ventana y el banco de filtros se calculan una sola vez y se comparten
+    entre todas las pistas con los mismos parámetros.
+    """
+
+    def __init__(self, sample_rate, n_fft, hop_length, n_mels, power=1.0, backend='numpy'):
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+        self.power = power
+        self.backend = backend
+
+        # Tablas precalculadas: ventana (una fila por frame) y banco de mel
+        if backend == 'librosa':
+            import librosa
+            self.window = librosa.filters.get_window('hann', n_fft, fftbins=True).astype(np.float32)
+            self.mel_basis = librosa.filters.mel(sr=sample_rate, n_fft=n_fft, n_mels=n_mels)
+        else:
+            self.window = hann_window(n_fft)
+            self.mel_basis = mel_filterbank(sample_rate, n_fft, n_mels)
+        self.padding = np.zeros(n_fft // 2, dtype=np.float32)
+
+    @property
+    def key(self):
+        return (self.sample_rate, self.n_fft, self.hop_length, self.n_mels)
+
+    def num_frames(self, num_samples):
+        """Frames completos que caben en num_samples muestras (sin relleno)"""
+        if num_samples < self.n_fft:
+            return 0
+        return 1 + (num_samples - self.n_fft) // self.hop_length
+
+    def frames_to_mel(self, samples):
+        """Espectrograma de mel (bandas x frames) de muestras ya rellenadas"""
+        samples = np.ascontiguousarray(samples, dtype=np.float32)
+        frames = frame_signal(samples, self.n_fft, self.hop_length)
+        mel = np.empty((self.n_mels, frames.shape[0]), dtype=np.float32)
+
+        # FFT por lotes de frames para no materializar todo el espectro
+        for start in range(0, frames.shape[0], FFT_BATCH_FRAMES):
+            end = min(start + FFT_BATCH_FRAMES, frames.shape[0])
+            magnitudes = np.abs(fft_backend.rfft(frames[start:end] * self.window, axis=1))
+            if self.power != 1.0:
+                magnitudes **= self.power
+            np.matmul(self.mel_basis, magnitudes.T, out=mel[:, start:end])
+        return mel
+
+    def mel_spectrogram(self, y):
+        """Espectrograma de mel de una señal completa, centrado como en librosa"""
+        samples = np.concatenate([self.padding, np.asarray(y, dtype=np.float32), self.padding])
+        return self.frames_to_mel(samples)
+
+class AnalysisPlanCache:
+    """Planes de análisis por (frecuencia, n_fft, hop, n_mels), seguros entre hilos"""
+
+    def __init__(self, backend='numpy'):
+        self.backend = backend
+        self.plans = {}
+        self.lock = threading.Lock()
+
+    def get(self, sample_rate, n_fft, hop_length, n_mels, power=1.0):
+        key = (sample_rate, n_fft, hop_length, n_mels, power)
+        with self.lock:
+            plan = self.plans.get(key)
+            if plan is None:
+                plan = self.create_plan(sample_rate, n_fft, hop_length, n_mels, power)
+                self.plans[key] = plan
+                logger.debug(f"Plan de análisis creado: sr={sample_rate}, n_fft={n_fft}, "
+                             f"hop={hop_length}, n_mels={n_mels}, backend={plan.backend}")
+            return plan
+
+    def create_plan(self, sample_rate, n_fft, hop_length, n_mels, power):
+        if self.backend == 'librosa':
+            try:
+                return AnalysisPlan(sample_rate, n_fft, hop_length, n_mels, power, backend='librosa')
+            except ImportError:
+                logger.warning("librosa no está instalado, se usa el análisis con NumPy")
+                self.backend = 'numpy'
+        return AnalysisPlan(sample_rate, n_fft, hop_length, n_mels, power)
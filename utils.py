@@ -63,7 +63,7 @@ def calculate_file_hash(file_path, algorithm='md5'):
     try:
         hash_algo = hashlib.new(algorithm)
         with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
                 hash_algo.update(chunk)
         return hash_algo.hexdigest()
     except Exception as e:
@@ -196,6 +196,62 @@ def get_audio_info(audio_path):
         logger.error(f"Error al obtener información de audio de {audio_path}: {e}")
         return None
 
+def load_json_file(file_path, default=None):
+    """Cargar un archivo JSON, devolviendo un valor por defecto si no existe o está dañado"""
+    try:
+        if not os.path.exists(file_path):
+            return default
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"No se pudo leer {file_path}: {e}")
+        return default
+
+def save_json_file(file_path, data):
+    """Guardar datos en JSON de forma atómica (archivo temporal + reemplazo)"""
+    try:
+        ensure_directory(os.path.dirname(file_path))
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, file_path)
+        return True
+    except Exception as e:
+        logger.error(f"Error al guardar {file_path}: {e}")
+        return False
+
+def get_audio_codec_args(audio_path, audio_codec, audio_bitrate):
+    """Argumentos de audio para ffmpeg: copiar el stream si ya está en el códec final"""
+    info = get_audio_info(audio_path)
+    if info and info['codec'] == audio_codec:
+        logger.info(f"Audio ya codificado en {audio_codec}, se copia sin recodificar")
+        return ['-c:a', 'copy']
+    return ['-c:a', audio_codec, '-b:a', audio_bitrate]
+
+def get_video_stream_info(video_path):
+    """Ancho, alto y formato de píxel del primer stream de video (ffprobe)"""
+    try:
+        cmd = [
+            'ffprobe', '-v', 'quiet', '-print_format', 'json',
+            '-show_streams', '-select_streams', 'v:0', video_path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        
+        streams = json.loads(result.stdout).get('streams', [])
+        if not streams:
+            return None
+        return {
+            'width': int(streams[0]['width']),
+            'height': int(streams[0]['height']),
+            'pix_fmt': streams[0].get('pix_fmt', '')
+        }
+    
+    except Exception as e:
+        logger.error(f"Error al obtener información de video de {video_path}: {e}")
+        return None
+
 def progress_bar(current, total, width=50, prefix='Progress'):
     """Mostrar barra de progreso en la consola"""
     try:
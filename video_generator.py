@@ -5,11 +5,84 @@ import logging
 from PIL import Image, ImageDraw
 import subprocess
 import json
-from config import VIDEO_CONFIG, FILES_CONFIG, CHROMA_CONFIG
+import queue
+import threading
+from types import SimpleNamespace
+from config import VIDEO_CONFIG, FILES_CONFIG, CHROMA_CONFIG, PROCESS_CONFIG
+from utils import get_audio_codec_args, get_audio_info, get_video_stream_info
+from ffmpeg_pipe import FFmpegFrameWriter, FFmpegFrameReader
+from frame_pipeline import FramePipeline
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class FrameCompositor:
+    """Composición de frames de visualización sin reservar memoria por frame
+    
+    Los buffers de la máscara y de la mezcla se crean una vez por hilo y
+    tamaño de frame y se reutilizan; la mezcla es en punto fijo uint8 con operaciones
+    saturadas de OpenCV (fg * a / 255 + bg * (255 - a) / 255) escritas en el
+    destino, en lugar de convertir ambos frames a float32.
+    """
+    
+    def __init__(self, lower_green, upper_green, blur_radius, dilate_kernel):
+        self.lower_green = np.array(lower_green, dtype=np.uint8)
+        self.upper_green = np.array(upper_green, dtype=np.uint8)
+        self.blur_size = (blur_radius, blur_radius)
+        self.kernel = np.ones((dilate_kernel, dilate_kernel), np.uint8)
+        # Buffers por hilo: varios trabajadores pueden componer a la vez
+        self.local = threading.local()
+    
+    def get_buffers(self, height, width):
+        """Buffers de trabajo para frames de alto x ancho (creados una vez por hilo)"""
+        buffers = getattr(self.local, 'buffers', None)
+        if buffers is None:
+            buffers = self.local.buffers = {}
+        key = (height, width)
+        if key not in buffers:
+            buffers[key] = SimpleNamespace(
+                hsv=np.empty((height, width, 3), np.uint8),
+                color=np.empty((height, width, 3), np.uint8),
+                mask=np.empty((height, width), np.uint8),
+                mask_tmp=np.empty((height, width), np.uint8),
+                alpha=np.empty((height, width, 3), np.uint8),
+                alpha_inv=np.empty((height, width, 3), np.uint8),
+                weighted_fg=np.empty((height, width, 3), np.uint8),
+                weighted_bg=np.empty((height, width, 3), np.uint8)
+            )
+        return buffers[key]
+    
+    def blend(self, color, alpha, background, out, buffers):
+        """out = color * alpha + background * (1 - alpha) con alfa uint8 de un canal"""
+        cv2.cvtColor(alpha, cv2.COLOR_GRAY2BGR, dst=buffers.alpha)
+        cv2.bitwise_not(buffers.alpha, dst=buffers.alpha_inv)
+        cv2.multiply(color, buffers.alpha, dst=buffers.weighted_fg, scale=1 / 255)
+        cv2.multiply(background, buffers.alpha_inv, dst=buffers.weighted_bg, scale=1 / 255)
+        cv2.add(buffers.weighted_fg, buffers.weighted_bg, dst=out)
+        return out
+    
+    def chroma_key(self, foreground, background, out):
+        """Quitar el fondo verde de foreground (BGR) y mezclarlo sobre background"""
+        buffers = self.get_buffers(*foreground.shape[:2])
+        
+        # Máscara del verde en HSV, limpiada con el mismo kernel en cada frame
+        cv2.cvtColor(foreground, cv2.COLOR_BGR2HSV, dst=buffers.hsv)
+        cv2.inRange(buffers.hsv, self.lower_green, self.upper_green, dst=buffers.mask)
+        cv2.morphologyEx(buffers.mask, cv2.MORPH_CLOSE, self.kernel, dst=buffers.mask_tmp)
+        cv2.morphologyEx(buffers.mask_tmp, cv2.MORPH_OPEN, self.kernel, dst=buffers.mask)
+        cv2.GaussianBlur(buffers.mask, self.blur_size, 0, dst=buffers.mask_tmp)
+        
+        # Alfa: se conserva lo que NO es verde
+        cv2.bitwise_not(buffers.mask_tmp, dst=buffers.mask)
+        return self.blend(foreground, buffers.mask, background, out, buffers)
+    
+    def alpha_blend(self, foreground, background, out):
+        """Mezclar un frame BGRA sobre background usando su canal alfa"""
+        buffers = self.get_buffers(*foreground.shape[:2])
+        cv2.extractChannel(foreground, 3, dst=buffers.mask)
+        cv2.cvtColor(foreground, cv2.COLOR_BGRA2BGR, dst=buffers.color)
+        return self.blend(buffers.color, buffers.mask, background, out, buffers)
+
 class VideoGenerator:
     def __init__(self):
         self.width = VIDEO_CONFIG['width']
@@ -25,6 +98,12 @@ class VideoGenerator:
         self.upper_green = np.array(CHROMA_CONFIG['upper_green'])
         self.blur_radius = CHROMA_CONFIG['blur_radius']
         self.dilate_kernel = CHROMA_CONFIG['dilate_kernel']
+        self.compositor = FrameCompositor(self.lower_green, self.upper_green,
+                                          self.blur_radius, self.dilate_kernel)
+        
+        # Canalización de composición (modo "composite")
+        self.composite_workers = PROCESS_CONFIG['composite_workers']
+        self.composite_queue_size = PROCESS_CONFIG['composite_queue_size']
         
     def load_background_image(self, image_path):
         """Cargar y redimensionar imagen de fondo"""
@@ -87,44 +166,46 @@ class VideoGenerator:
             logger.error(f"Error al obtener duración de video: {e}")
             return 0.0
     
-    def apply_chroma_key(self, foreground, background):
-        """Aplicar chroma key (eliminar fondo verde)"""
+    def apply_chroma_key(self, foreground, background, out=None):
+        """Aplicar chroma key (eliminar fondo verde)
+        
+        Con out=background la composición se escribe en el propio fondo y no
+        se reserva memoria por frame.
+        """
         try:
             # Verificar y ajustar dimensiones
             if foreground.shape[:2] != background.shape[:2]:
                 logger.debug(f"Redimensionando foreground de {foreground.shape[:2]} a {background.shape[:2]}")
                 foreground = cv2.resize(foreground, (background.shape[1], background.shape[0]))
             
-            # Convertir a HSV para mejor detección de verde
-            hsv = cv2.cvtColor(foreground, cv2.COLOR_BGR2HSV)
-            
-            # Crear máscara para el fondo verde
-            mask = cv2.inRange(hsv, self.lower_green, self.upper_green)
-            
-            # Aplicar morfología para limpiar la máscara
-            kernel = np.ones((self.dilate_kernel, self.dilate_kernel), np.uint8)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-            
-            # Aplicar suavizado
-            mask = cv2.GaussianBlur(mask, (self.blur_radius, self.blur_radius), 0)
-            
-            # Invertir máscara (queremos mantener lo que NO es verde)
-            mask_inv = cv2.bitwise_not(mask)
-            
-            # Normalizar máscara
-            mask_norm = mask_inv.astype(np.float32) / 255.0
-            mask_norm = np.expand_dims(mask_norm, axis=2)
-            
-            # Aplicar chroma key
-            result = foreground.astype(np.float32) * mask_norm + background.astype(np.float32) * (1 - mask_norm)
-            
-            return result.astype(np.uint8)
+            if out is None:
+                out = np.empty_like(background)
+            return self.compositor.chroma_key(foreground, background, out)
             
         except Exception as e:
             logger.error(f"Error al aplicar chroma key: {e}")
             return background
     
+    def alpha_blend(self, foreground, background, out=None):
+        """Mezclar un frame BGRA sobre el fondo BGR usando su canal alfa"""
+        if out is None:
+            out = np.empty_like(background)
+        return self.compositor.alpha_blend(foreground, background, out)
+    
+    def composite_visualization(self, foreground, background, out=None):
+        """Superponer un frame de visualización: mezcla alfa si la trae, si no chroma key"""
+        if foreground.shape[2] == 4:
+            return self.alpha_blend(foreground, background, out)
+        return self.apply_chroma_key(foreground, background, out)
+    
+    def open_visualization(self, video_path):
+        """Abrir una visualización; las que tienen canal alfa se leen con ffmpeg en BGRA"""
+        info = get_video_stream_info(video_path)
+        if info and (info['pix_fmt'].startswith('yuva') or info['pix_fmt'] in ('bgra', 'rgba', 'argb', 'abgr', 'gbrap')):
+            return FFmpegFrameReader(video_path, info['width'], info['height'], pix_fmt='bgra')
+        # OpenCV descarta el canal alfa: solo para visualizaciones sobre verde
+        return cv2.VideoCapture(video_path)
+    
     def create_base_video(self, background_image_path, audio_path, output_path):
         """Crear video base con imagen de fondo y audio"""
         try:
@@ -142,15 +223,15 @@ class VideoGenerator:
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             
             # Usar ffmpeg para crear video base
+            audio_args = get_audio_codec_args(audio_path, self.audio_codec, self.audio_bitrate)
             cmd = [
                 'ffmpeg', '-y',
                 '-loop', '1',
                 '-i', background_image_path if os.path.exists(background_image_path) else 'temp_bg.jpg',
                 '-i', audio_path,
                 '-c:v', self.video_codec,
-                '-c:a', self.audio_codec,
                 '-b:v', self.bitrate,
-                '-b:a', self.audio_bitrate,
+                *audio_args,
                 '-r', str(self.fps),
                 '-shortest',
                 '-pix_fmt', 'yuv420p',
@@ -162,7 +243,7 @@ class VideoGenerator:
             if not os.path.exists(background_image_path):
                 temp_bg_path = os.path.join(os.path.dirname(output_path), 'temp_bg.jpg')
                 cv2.imwrite(temp_bg_path, background)
-                cmd[3] = temp_bg_path
+                cmd[5] = temp_bg_path
             
             logger.info("Ejecutando ffmpeg para crear video base...")
             result = subprocess.run(cmd, capture_output=True, text=True)
@@ -182,8 +263,144 @@ class VideoGenerator:
             logger.error(f"Error al crear video base: {e}")
             return False
     
-    def overlay_visualizations(self, base_video_path, visualization_videos, output_path):
-        """Superponer visualizaciones sobre el video base usando chroma key"""
+    def open_visualizations(self, visualization_videos):
+        """Abrir los videos de visualización que se puedan leer"""
+        viz_caps = []
+        for viz_video in visualization_videos:
+            cap = self.open_visualization(viz_video)
+            if cap.isOpened():
+                viz_caps.append(cap)
+            else:
+                logger.warning(f"No se pudo abrir visualización: {viz_video}")
+        return viz_caps
+    
+    def iter_frames(self, cap):
+        """Frames de un video abierto hasta que se agote"""
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame
+    
+    def iter_timeline_frames(self, segments):
+        """Frames de visualización en la línea de tiempo del audio combinado
+        
+        segments es la lista de (visualización, duración) en el orden de la
+        lista. Cada pista empieza en la suma de las duraciones anteriores y
+        ocupa exactamente sus frames (redondeo acumulado, como el modo
+        fusionado): si su video es más corto se repite el último frame y si es
+        más largo se corta. Solo hay un decodificador abierto a la vez; las
+        pistas sin visualización entregan None (no se superpone nada).
+        """
+        emitted = 0
+        elapsed = 0.0
+        for viz_video, duration in segments:
+            elapsed += duration
+            target = int(round(elapsed * self.fps)) - emitted
+            
+            count = 0
+            last_frame = None
+            cap = self.open_visualization(viz_video) if viz_video else None
+            if cap is not None and not cap.isOpened():
+                logger.warning(f"No se pudo abrir visualización: {viz_video}")
+                cap = None
+            try:
+                while cap is not None and count < target:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    last_frame = frame
+                    yield frame
+                    count += 1
+            finally:
+                if cap is not None:
+                    cap.release()
+            
+            while count < target:
+                yield last_frame
+                count += 1
+            emitted += count
+    
+    def open_visualization_sources(self, visualization_videos, durations=None):
+        """Fuentes de frames de visualización como (fuentes, nombres, capturas abiertas)
+        
+        Con durations las visualizaciones se reproducen una tras otra según la
+        línea de tiempo; sin ellas se superponen todas a la vez desde el inicio.
+        """
+        if durations is not None:
+            segments = list(zip(visualization_videos, durations))
+            return [self.iter_timeline_frames(segments)], ['viz (línea de tiempo)'], []
+        
+        viz_caps = self.open_visualizations([viz for viz in visualization_videos if viz])
+        sources = [self.iter_frames(cap) for cap in viz_caps]
+        names = [f'viz {i + 1}' for i in range(len(viz_caps))]
+        return sources, names, viz_caps
+    
+    def iter_base_frames(self, cap_base):
+        """Frames del video base con las dimensiones de salida"""
+        for frame_base in self.iter_frames(cap_base):
+            if frame_base.shape[:2] != (self.height, self.width):
+                logger.debug(f"Redimensionando frame base de {frame_base.shape[:2]} a ({self.height}, {self.width})")
+                frame_base = cv2.resize(frame_base, (self.width, self.height))
+            yield frame_base
+    
+    def composite_frames(self, frame, viz_frames, placement=None):
+        """Componer sobre frame (en el sitio) un frame de cada visualización
+        
+        Las visualizaciones que ya terminaron llegan como None y se omiten.
+        """
+        for frame_viz in viz_frames:
+            if frame_viz is None:
+                continue
+            
+            if placement is not None and frame_viz.shape[:2] != (self.height, self.width):
+                # Franja de la visualización: composición solo sobre su región
+                x, y = placement
+                h, w = frame_viz.shape[:2]
+                region = frame[y:y + h, x:x + w]
+                self.composite_visualization(frame_viz[:region.shape[0], :region.shape[1]], region, out=region)
+                continue
+            
+            # Redimensionar frame de visualización si es necesario
+            if frame_viz.shape[:2] != (self.height, self.width):
+                logger.debug(f"Redimensionando frame de {frame_viz.shape[:2]} a ({self.height}, {self.width})")
+                frame_viz = cv2.resize(frame_viz, (self.width, self.height))
+            
+            # Aplicar mezcla alfa o chroma key
+            self.composite_visualization(frame_viz, frame, out=frame)
+        return frame
+    
+    def run_composite_pipeline(self, pipeline, base_frames, viz_sources, viz_names, out, placement=None,
+                               recycle=None):
+        """Decodificar, componer y codificar en etapas solapadas
+        
+        Cada video se decodifica en su hilo, los frames se componen en un grupo
+        de hilos y se codifican en orden en este hilo. recycle recibe cada
+        frame ya codificado para reutilizar su buffer.
+        """
+        def sink(frame):
+            out.write(frame)
+            if recycle is not None:
+                recycle(frame)
+            if out.frame_count % 100 == 0:
+                logger.info(f"Procesados {out.frame_count} frames")
+        
+        return pipeline.run([base_frames] + viz_sources,
+                            lambda frame, viz_frames: self.composite_frames(frame, viz_frames, placement),
+                            sink, ['base'] + viz_names)
+    
+    def overlay_visualizations(self, base_video_path, visualization_videos, output_path, placement=None,
+                               durations=None):
+        """Superponer visualizaciones sobre el video base (canal alfa o chroma key)
+        
+        Si las visualizaciones son una franja menor que el frame (región de
+        interés), se superponen en placement = (x, y); sin placement se escalan
+        al frame completo como antes. Con durations (una por visualización)
+        cada una aparece en su tramo de la línea de tiempo.
+        """
+        out = None
+        cap_base = None
+        viz_caps = []
         try:
             logger.info(f"Superponiendo visualizaciones en: {output_path}")
             
@@ -197,104 +414,169 @@ class VideoGenerator:
                 logger.error(f"No se pudo abrir video base: {base_video_path}")
                 return False
             
-            # Configurar escritor de video
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(output_path, fourcc, self.fps, (self.width, self.height))
-            
-            # Verificar que el escritor se abrió correctamente
-            if not out.isOpened():
-                logger.error(f"No se pudo abrir el escritor de video: {output_path}")
-                return False
-            
             # Abrir videos de visualización
-            viz_caps = []
-            for viz_video in visualization_videos:
-                cap = cv2.VideoCapture(viz_video)
-                if cap.isOpened():
-                    viz_caps.append(cap)
-                else:
-                    logger.warning(f"No se pudo abrir visualización: {viz_video}")
-            
-            if not viz_caps:
+            viz_sources, viz_names, viz_caps = self.open_visualization_sources(visualization_videos, durations)
+            if not viz_sources:
                 logger.error("No se pudieron abrir videos de visualización")
-                cap_base.release()
-                out.release()
                 return False
             
-            frame_count = 0
-            while True:
-                ret_base, frame_base = cap_base.read()
-                if not ret_base:
-                    break
-                
-                # Asegurar que el frame base tiene las dimensiones correctas
-                if frame_base.shape[:2] != (self.height, self.width):
-                    logger.debug(f"Redimensionando frame base de {frame_base.shape[:2]} a ({self.height}, {self.width})")
-                    frame_base = cv2.resize(frame_base, (self.width, self.height))
-                
-                result_frame = frame_base.copy()
-                
-                # Superponer cada visualización
-                for cap_viz in viz_caps:
-                    ret_viz, frame_viz = cap_viz.read()
-                    if ret_viz:
-                        # Redimensionar frame de visualización si es necesario
-                        if frame_viz.shape[:2] != (self.height, self.width):
-                            logger.debug(f"Redimensionando frame de {frame_viz.shape[:2]} a ({self.height}, {self.width})")
-                            frame_viz = cv2.resize(frame_viz, (self.width, self.height))
-                        
-                        # Aplicar chroma key
-                        result_frame = self.apply_chroma_key(frame_viz, result_frame)
-                
-                # Verificar que el frame tiene las dimensiones correctas
-                if result_frame.shape[:2] == (self.height, self.width):
-                    out.write(result_frame)
-                    frame_count += 1
-                    
-                    if frame_count % 100 == 0:
-                        logger.info(f"Procesados {frame_count} frames")
-                else:
-                    current_h, current_w = result_frame.shape[:2]
-                    logger.warning(f"Frame con dimensiones incorrectas: altura={current_h}, ancho={current_w}, esperado: altura={self.height}, ancho={self.width}")
-            
-            # Limpiar recursos
-            cap_base.release()
+            # Configurar escritor de video: los frames compuestos se codifican una
+            # sola vez y el audio del video base se copia sin recodificar
+            out = FFmpegFrameWriter(output_path, self.width, self.height, self.fps,
+                                    profile='final', audio_path=base_video_path,
+                                    audio_args=['-c:a', 'copy'])
+            
+            # Cada lectura del video base entrega un frame nuevo: se compone sobre él
+            pipeline = FramePipeline(self.composite_workers, self.composite_queue_size)
+            self.run_composite_pipeline(pipeline, self.iter_base_frames(cap_base), viz_sources, viz_names,
+                                        out, placement)
+            
+            if not out.close():
+                return False
+            
+            logger.info(f"Video con visualizaciones creado: {output_path}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error al superponer visualizaciones: {e}")
+            if out is not None:
+                out.abort()
+            return False
+        finally:
+            if cap_base is not None:
+                cap_base.release()
             for cap in viz_caps:
                 cap.release()
-            out.release()
+    
+    def overlay_on_background(self, background, audio_path, visualization_videos, output_path, placement=None,
+                              durations=None):
+        """Superponer visualizaciones sobre una imagen de fondo fija
+        
+        El fondo ya escalado se mantiene en memoria durante todo el render: no
+        hace falta codificar un video base con la imagen en bucle ni volver a
+        decodificarlo frame a frame. El audio se codifica en la misma pasada.
+        Con durations las visualizaciones siguen la línea de tiempo del audio;
+        deben ser las duraciones exactas de cada pista en el audio combinado
+        (AudioProcessor.get_track_durations), no las de los metadatos.
+        """
+        out = None
+        viz_caps = []
+        try:
+            logger.info(f"Superponiendo visualizaciones sobre fondo fijo en: {output_path}")
             
-            logger.info(f"Video con visualizaciones creado: {output_path}")
+            if not os.path.exists(audio_path):
+                logger.error(f"Archivo de audio no encontrado: {audio_path}")
+                return False
+            
+            if durations is not None:
+                # La línea de tiempo ya fija la duración: la suma de las pistas,
+                # con el mismo redondeo acumulado que iter_timeline_frames
+                num_frames = int(round(sum(durations) * self.fps))
+            else:
+                audio_info = get_audio_info(audio_path)
+                if not audio_info or not audio_info['duration']:
+                    logger.error(f"No se pudo obtener la duración de {audio_path}")
+                    return False
+                # ffmpeg corta con -shortest lo que sobre respecto al audio
+                num_frames = int(np.ceil(audio_info['duration'] * self.fps))
+            
+            if background.shape[:2] != (self.height, self.width):
+                background = cv2.resize(background, (self.width, self.height))
+            
+            viz_sources, viz_names, viz_caps = self.open_visualization_sources(visualization_videos, durations)
+            if not viz_sources:
+                logger.error("No se pudieron abrir videos de visualización")
+                return False
+            
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            audio_args = get_audio_codec_args(audio_path, self.audio_codec, self.audio_bitrate)
+            out = FFmpegFrameWriter(output_path, self.width, self.height, self.fps,
+                                    profile='final', audio_path=audio_path, audio_args=audio_args)
+            
+            # Buffers reciclados: tantos como frames puede haber en vuelo entre
+            # etapas; si se agotan, la base espera al codificador (contrapresión)
+            pipeline = FramePipeline(self.composite_workers, self.composite_queue_size)
+            free_frames = queue.Queue()
+            for _ in range(3 * pipeline.queue_size + pipeline.workers):
+                free_frames.put(np.empty_like(background))
+            
+            def base_frames():
+                for _ in range(num_frames):
+                    frame = pipeline.get(free_frames)
+                    np.copyto(frame, background)
+                    yield frame
+            
+            self.run_composite_pipeline(pipeline, base_frames(), viz_sources, viz_names, out, placement,
+                                        recycle=free_frames.put)
+            
+            if not out.close():
+                return False
+            
+            logger.info(f"Video creado: {output_path} ({out.frame_count} frames)")
             return True
             
         except Exception as e:
             logger.error(f"Error al superponer visualizaciones: {e}")
+            if out is not None:
+                out.abort()
             return False
+        finally:
+            for cap in viz_caps:
+                cap.release()
     
-    def generate_final_video(self, audio_path, background_image_path, visualization_videos, output_path):
-        """Generar video final completo"""
+    
+    def encode_frames(self, frames, audio_path, output_path):
+        """Codificar frames ya compuestos junto con el audio en un único proceso ffmpeg"""
+        out = None
         try:
-            logger.info("Iniciando generación de video final...")
+            logger.info(f"Codificando video: {output_path}")
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
             
-            # Crear video base
-            base_video_path = os.path.join(os.path.dirname(output_path), 'temp_base_video.mp4')
+            audio_args = get_audio_codec_args(audio_path, self.audio_codec, self.audio_bitrate)
+            out = FFmpegFrameWriter(output_path, self.width, self.height, self.fps,
+                                    profile='final', audio_path=audio_path, audio_args=audio_args)
             
-            if not self.create_base_video(background_image_path, audio_path, base_video_path):
-                logger.error("Error al crear video base")
+            for frame in frames:
+                out.write(frame)
+                if out.frame_count % 1000 == 0:
+                    logger.info(f"Procesados {out.frame_count} frames")
+            
+            if not out.close():
                 return False
             
-            # Superponer visualizaciones si existen
-            if visualization_videos:
-                if not self.overlay_visualizations(base_video_path, visualization_videos, output_path):
+            logger.info(f"Video creado: {output_path} ({out.frame_count} frames)")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error al codificar video: {e}")
+            if out is not None:
+                out.abort()
+            return False
+    
+    def generate_final_video(self, audio_path, background_image_path, visualization_videos, output_path,
+                             placement=None, durations=None):
+        """Generar video final completo
+        
+        durations (una por visualización, en el orden de la lista) coloca cada
+        visualización en el tramo exacto de su pista en el audio combinado; las
+        entradas None son pistas sin visualización.
+        """
+        try:
+            logger.info("Iniciando generación de video final...")
+            
+            if any(visualization_videos):
+                # El fondo es una imagen fija: se compone sobre ella en memoria,
+                # sin codificar ni decodificar un video base intermedio
+                background = self.load_background_image(background_image_path)
+                if not self.overlay_on_background(background, audio_path, visualization_videos,
+                                                  output_path, placement, durations):
                     logger.error("Error al superponer visualizaciones")
                     return False
             else:
-                # Si no hay visualizaciones, usar el video base como final
-                import shutil
-                shutil.copy2(base_video_path, output_path)
-            
-            # Limpiar archivo temporal
-            if os.path.exists(base_video_path):
-                os.remove(base_video_path)
+                # Si no hay visualizaciones, el video base es el video final
+                if not self.create_base_video(background_image_path, audio_path, output_path):
+                    logger.error("Error al crear video base")
+                    return False
             
             logger.info(f"Video final generado exitosamente: {output_path}")
             return True
@@ -4,6 +4,7 @@ import subprocess
 import json
 import numpy as np
 from config import VIDEO_CONFIG, FILES_CONFIG, CHROMA_CONFIG, VISUALIZER_OPTIMIZED_CONFIG
+from utils import get_audio_codec_args
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -52,6 +53,7 @@ class OptimizedVideoGenerator:
         try:
             logger.info(f"Creando video con waveform: {output_path}")
             
+            audio_args = get_audio_codec_args(audio_path, self.audio_codec, self.audio_bitrate)
             cmd = [
                 'ffmpeg', '-y',
                 '-i', audio_path,
@@ -60,9 +62,8 @@ class OptimizedVideoGenerator:
                 '-map', '[v]',
                 '-map', '0:a',
                 '-c:v', self.video_codec,
-                '-c:a', self.audio_codec,
                 '-b:v', self.bitrate,
-                '-b:a', self.audio_bitrate,
+                *audio_args,
                 '-r', str(self.fps),
                 '-pix_fmt', 'yuv420p',
                 output_path
@@ -90,6 +91,7 @@ class OptimizedVideoGenerator:
         try:
             logger.info(f"Creando video con espectro: {output_path}")
             
+            audio_args = get_audio_codec_args(audio_path, self.audio_codec, self.audio_bitrate)
             cmd = [
                 'ffmpeg', '-y',
                 '-i', audio_path,
@@ -98,9 +100,8 @@ class OptimizedVideoGenerator:
                 '-map', '[v]',
                 '-map', '0:a',
                 '-c:v', self.video_codec,
-                '-c:a', self.audio_codec,
                 '-b:v', self.bitrate,
-                '-b:a', self.audio_bitrate,
+                *audio_args,
                 '-r', str(self.fps),
                 '-pix_fmt', 'yuv420p',
                 output_path
@@ -127,15 +128,15 @@ class OptimizedVideoGenerator:
         try:
             logger.info(f"Creando video de fondo: {output_path}")
             
+            audio_args = get_audio_codec_args(audio_path, self.audio_codec, self.audio_bitrate)
             cmd = [
                 'ffmpeg', '-y',
                 '-loop', '1',
                 '-i', background_image_path,
                 '-i', audio_path,
                 '-c:v', self.video_codec,
-                '-c:a', self.audio_codec,
                 '-b:v', self.bitrate,
-                '-b:a', self.audio_bitrate,
+                *audio_args,
                 '-r', str(self.fps),
                 '-shortest',
                 '-vf', f'scale={self.width}:{self.height}',
@@ -194,41 +195,59 @@ class OptimizedVideoGenerator:
             logger.error(f"Error al superponer videos: {e}")
             return False
     
-    def generate_final_video_optimized(self, audio_path, background_image_path, output_path):
-        """Generar video final optimizado usando solo FFmpeg"""
+    def generate_final_video_optimized(self, audio_path, background_image_path, output_path, overlay_opacity=0.7):
+        """Generar video final optimizado usando solo FFmpeg
+        
+        Un único grafo de filtros lee la imagen y el audio una vez: escala el
+        fondo, dibuja el espectro, lo superpone con la opacidad indicada y
+        codifica el resultado una sola vez, sin videos temporales intermedios.
+        """
         try:
             logger.info("=== GENERANDO VIDEO FINAL OPTIMIZADO ===")
             
             # Crear directorio de salida
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             
-            # Archivos temporales
-            temp_dir = os.path.dirname(output_path)
-            background_video = os.path.join(temp_dir, 'temp_background.mp4')
-            spectrum_video = os.path.join(temp_dir, 'temp_spectrum.mp4')
-            
-            # 1. Crear video de fondo
-            logger.info("Paso 1/3: Creando video de fondo...")
-            if not self.create_background_video(background_image_path, audio_path, background_video):
-                return False
+            # El espectro se aplana a opaco (como al codificarlo en yuv420p) y se
+            # mezcla con la opacidad indicada sobre el fondo
+            filter_complex = (
+                f'[0:v]scale={self.width}:{self.height},fps={self.fps}[bg];'
+                f'[1:a]showfreqs=s={self.width}x{self.height}:mode=bar:colors=fire:rate={self.fps},'
+                f'format=yuv420p,format=yuva420p,colorchannelmixer=aa={overlay_opacity}[spectrum];'
+                f'[bg][spectrum]overlay=shortest=1[v]'
+            )
             
-            # 2. Crear video con espectro
-            logger.info("Paso 2/3: Creando visualización de espectro...")
-            if not self.create_spectrum_video(audio_path, spectrum_video):
-                return False
+            audio_args = get_audio_codec_args(audio_path, self.audio_codec, self.audio_bitrate)
+            cmd = [
+                'ffmpeg', '-y',
+                '-loop', '1',
+                '-framerate', str(self.fps),
+                '-i', background_image_path,
+                '-i', audio_path,
+                '-filter_complex', filter_complex,
+                '-map', '[v]',
+                '-map', '1:a',
+                '-c:v', self.video_codec,
+                '-b:v', self.bitrate,
+                *audio_args,
+                '-r', str(self.fps),
+                '-shortest',
+                '-pix_fmt', 'yuv420p',
+                output_path
+            ]
             
-            # 3. Superponer videos
-            logger.info("Paso 3/3: Superponiendo videos...")
-            if not self.overlay_videos(background_video, spectrum_video, output_path):
-                return False
+            if self.gpu_available:
+                cmd.extend(['-gpu', '0'])
             
-            # Limpiar archivos temporales
-            for temp_file in [background_video, spectrum_video]:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
+            logger.debug(f"Filtro complejo: {filter_complex}")
+            result = subprocess.run(cmd, capture_output=True, text=True)
             
-            logger.info(f"Video final generado exitosamente: {output_path}")
-            return True
+            if result.returncode == 0:
+                logger.info(f"Video final generado exitosamente: {output_path}")
+                return True
+            else:
+                logger.error(f"Error en FFmpeg: {result.stderr}")
+                return False
             
         except Exception as e:
             logger.error(f"Error al generar video final optimizado: {e}")
@@ -258,6 +277,7 @@ class OptimizedVideoGenerator:
                     f'[bg][wave]overlay=x=0:y=H-h-{self.viz_position_from_bottom}[v]'
                 )
             
+            audio_args = get_audio_codec_args(audio_path, self.audio_codec, self.audio_bitrate)
             cmd = [
                 'ffmpeg', '-y',
                 '-loop', '1',
@@ -267,9 +287,8 @@ class OptimizedVideoGenerator:
                 '-map', '[v]',
                 '-map', '1:a',
                 '-c:v', self.video_codec,
-                '-c:a', self.audio_codec,
                 '-b:v', self.bitrate,
-                '-b:a', self.audio_bitrate,
+                *audio_args,
                 '-r', str(self.fps),
                 '-shortest',
                 '-pix_fmt', 'yuv420p',
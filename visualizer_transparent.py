@@ -1,187 +1,763 @@
-import numpy as np
-import librosa
-from PIL import Image, ImageDraw
-import cv2
-import os
-import logging
-from config import VIDEO_CONFIG, VISUALIZER_CONFIG
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-class AudioVisualizer:
-    def __init__(self, config=None):
-        """Inicializar el visualizador de audio con configuración"""
-        if config is None:
-            config = {}
-        
-        # Configuración de video
-        self.width = config.get('width', VIDEO_CONFIG['width'])
-        self.height = config.get('height', VIDEO_CONFIG['height'])
-        self.fps = config.get('fps', VIDEO_CONFIG['fps'])
-        
-        # Configuración del visualizador
-        self.num_bars = config.get('num_bars', VISUALIZER_CONFIG['num_bars'])
-        self.margin_x = config.get('margin_x', VISUALIZER_CONFIG['margin_x'])
-        self.background_color = config.get('background_color', VISUALIZER_CONFIG['background_color'])
-        self.bar_color = config.get('bar_color', VISUALIZER_CONFIG['bar_color'])
-        self.gap = config.get('gap', VISUALIZER_CONFIG['gap'])
-        self.vertical_offset = config.get('vertical_offset', VISUALIZER_CONFIG['vertical_offset'])
-        self.n_fft = config.get('n_fft', VISUALIZER_CONFIG['n_fft'])
-        self.power = config.get('power', VISUALIZER_CONFIG['power'])
-        
-        # Calcular dimensiones
-        self.max_bar_height = self.height // 3
-        self.region_bottom = self.height - self.vertical_offset
-        
-        # Calcular ancho de cada barra
-        total_gap = self.gap * (self.num_bars - 1)
-        available_width = self.width - 2 * self.margin_x
-        self.bar_width = (available_width - total_gap) // self.num_bars
-        
-    def load_audio(self, audio_path):
-        """Cargar archivo de audio"""
-        try:
-            y, sr = librosa.load(audio_path, sr=None, mono=True)
-            logger.info(f"Audio cargado: {audio_path} (sr={sr}, duration={len(y)/sr:.2f}s)")
-            return y, sr
-        except Exception as e:
-            logger.error(f"Error al cargar audio {audio_path}: {e}")
-            return None, None
-    
-    def calculate_mel_spectrogram(self, y, sr):
-        """Calcular espectrograma de mel"""
-        try:
-            hop_length = int(sr / self.fps)
-            
-            mel_spec = librosa.feature.melspectrogram(
-                y=y,
-                sr=sr,
-                n_fft=self.n_fft,
-                hop_length=hop_length,
-                n_mels=self.num_bars,
-                power=self.power
-            )
-            
-            # Normalizar cada banda al rango [0,1]
-            band_max = np.max(mel_spec, axis=1, keepdims=True)
-            band_max[band_max == 0] = 1e-6
-            mel_spec_norm = mel_spec / band_max
-            
-            logger.info(f"Espectrograma calculado: {mel_spec_norm.shape[1]} frames")
-            return mel_spec_norm
-            
-        except Exception as e:
-            logger.error(f"Error al calcular espectrograma: {e}")
-            return None
-    
-    def create_frame(self, magnitudes):
-        """Crear un frame individual del visualizador"""
-        try:
-            # Crear lienzo
-            img = Image.new("RGB", (self.width, self.height), self.background_color)
-            draw = ImageDraw.Draw(img)
-            
-            # Dibujar barras verticales
-            for i, mag in enumerate(magnitudes):
-                bar_height = int(mag * self.max_bar_height)
-                x0 = self.margin_x + i * (self.bar_width + self.gap)
-                x1 = x0 + self.bar_width
-                y1 = self.region_bottom
-                y0 = self.region_bottom - bar_height
-                draw.rectangle([(x0, y0), (x1, y1)], fill=self.bar_color)
-            
-            # Convertir PIL a BGR para OpenCV
-            frame = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-            return frame
-            
-        except Exception as e:
-            logger.error(f"Error al crear frame: {e}")
-            return None
-    
-    def generate_visualization(self, audio_path, output_path):
-        """Generar visualización completa para un archivo de audio"""
-        try:
-            logger.info(f"Generando visualización: {audio_path} -> {output_path}")
-            
-            # Cargar audio
-            y, sr = self.load_audio(audio_path)
-            if y is None or sr is None:
-                return False
-            
-            # Calcular espectrograma
-            mel_spec_norm = self.calculate_mel_spectrogram(y, sr)
-            if mel_spec_norm is None:
-                return False
-            
-            # Crear directorio de salida si no existe
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            
-            # Preparar escritor de video
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            video_writer = cv2.VideoWriter(output_path, fourcc, self.fps, (self.width, self.height))
-            
-            # Generar frames
-            num_frames = mel_spec_norm.shape[1]
-            for frame_idx in range(num_frames):
-                if frame_idx % 100 == 0:
-                    logger.info(f"Procesando frame {frame_idx}/{num_frames}")
-                
-                magnitudes = mel_spec_norm[:, frame_idx]
-                frame = self.create_frame(magnitudes)
-                
-                if frame is not None:
-                    video_writer.write(frame)
-            
-            # Finalizar y guardar video
-            video_writer.release()
-            logger.info(f"Visualización guardada: {output_path}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error al generar visualización: {e}")
-            return False
-    
-    def generate_batch_visualizations(self, audio_files, output_dir):
-        """Generar visualizaciones para múltiples archivos de audio"""
-        results = []
-        
-        for i, audio_file in enumerate(audio_files):
-            try:
-                # Crear nombre de archivo de salida
-                base_name = os.path.splitext(os.path.basename(audio_file))[0]
-                output_file = os.path.join(output_dir, f"viz_{i:03d}_{base_name}.mp4")
-                
-                # Generar visualización
-                success = self.generate_visualization(audio_file, output_file)
-                results.append((audio_file, output_file, success))
-                
-            except Exception as e:
-                logger.error(f"Error en procesamiento por lotes para {audio_file}: {e}")
-                results.append((audio_file, None, False))
-        
-        return results
-
-# Mantener compatibilidad con el script original
-if __name__ == "__main__":
-    # Configuración por defecto para compatibilidad
-    default_config = {
-        'audio_path': "output_20250706195359_0.mp3",
-        'output_path': "audio_visualization_vertical.mp4"
-    }
-    
-    visualizer = AudioVisualizer()
-    
-    # Verificar si el archivo de audio existe
-    if os.path.exists(default_config['audio_path']):
-        success = visualizer.generate_visualization(
-            default_config['audio_path'], 
-            default_config['output_path']
-        )
-        if success:
-            print(f"Video guardado en '{default_config['output_path']}'")
-        else:
-            print("Error al generar la visualización")
-    else:
-        print(f"Archivo de audio no encontrado: {default_config['audio_path']}")
-        print("Usa: python visualizer_transparent.py <audio_file> <output_file>")
+import numpy as np
+from PIL import Image, ImageDraw
+import cv2
+import os
+import logging
+import threading
+import time
+from types import SimpleNamespace
+import subprocess
+from config import VIDEO_CONFIG, VISUALIZER_CONFIG, CACHE_CONFIG, CHROMA_CONFIG, FRAME_PIPE_CONFIG, TEMP_DIR
+from utils import get_audio_info
+from ffmpeg_pipe import FFmpegFrameWriter, iter_pcm_blocks
+from mel_analysis import AnalysisPlanCache
+from cache import DiskCache, get_feature_cache
+from library_index import LibraryIndex
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Versión del formato de los espectrogramas en caché (forma parte de la clave)
+FEATURE_VERSION = 1
+
+class AudioVisualizer:
+    def __init__(self, config=None, library=None):
+        """Inicializar el visualizador de audio con configuración"""
+        if config is None:
+            config = {}
+        self.config = dict(config)
+        
+        # Configuración de video
+        self.width = config.get('width', VIDEO_CONFIG['width'])
+        self.height = config.get('height', VIDEO_CONFIG['height'])
+        self.fps = config.get('fps', VIDEO_CONFIG['fps'])
+        
+        # Configuración del visualizador
+        self.num_bars = config.get('num_bars', VISUALIZER_CONFIG['num_bars'])
+        self.margin_x = config.get('margin_x', VISUALIZER_CONFIG['margin_x'])
+        self.background_color = config.get('background_color', VISUALIZER_CONFIG['background_color'])
+        self.bar_color = config.get('bar_color', VISUALIZER_CONFIG['bar_color'])
+        self.gap = config.get('gap', VISUALIZER_CONFIG['gap'])
+        self.vertical_offset = config.get('vertical_offset', VISUALIZER_CONFIG['vertical_offset'])
+        self.n_fft = config.get('n_fft', VISUALIZER_CONFIG['n_fft'])
+        self.power = config.get('power', VISUALIZER_CONFIG['power'])
+        self.analysis_sample_rate = config.get('analysis_sample_rate', VISUALIZER_CONFIG['analysis_sample_rate'])
+        self.mel_backend = config.get('mel_backend', VISUALIZER_CONFIG['mel_backend'])
+        self.streaming_analysis = config.get('streaming_analysis', VISUALIZER_CONFIG['streaming_analysis'])
+        self.analysis_block_seconds = config.get('analysis_block_seconds', VISUALIZER_CONFIG['analysis_block_seconds'])
+        self.region_of_interest = config.get('region_of_interest', VISUALIZER_CONFIG['region_of_interest'])
+        self.output_alpha = config.get('output_alpha', VISUALIZER_CONFIG['output_alpha'])
+        # Margen del chroma key alrededor de la franja y perfil del codificador
+        self.chroma_margin = config.get('chroma_margin',
+                                        CHROMA_CONFIG['dilate_kernel'] + CHROMA_CONFIG['blur_radius'])
+        self.pipe_settings = config.get('pipe_settings')
+        
+        # Calcular dimensiones
+        self.max_bar_height = self.height // 3
+        self.region_bottom = self.height - self.vertical_offset
+        
+        # Calcular ancho de cada barra
+        total_gap = self.gap * (self.num_bars - 1)
+        available_width = self.width - 2 * self.margin_x
+        self.bar_width = (available_width - total_gap) // self.num_bars
+        
+        # Caché de espectrogramas: cambiar colores, fondo o disposición de las
+        # barras no obliga a decodificar el audio ni a recalcular la STFT
+        self.feature_cache_enabled = config.get('feature_cache_enabled', CACHE_CONFIG['feature_cache_enabled'])
+        self.feature_cache = get_feature_cache() if self.feature_cache_enabled else None
+        self.library = library
+        self.feature_lock = threading.Lock()
+        self.active_feature_keys = set()
+        
+        # Planes de análisis (ventana y banco de mel) reutilizados entre pistas
+        self.analysis_plans = AnalysisPlanCache(self.mel_backend)
+        
+        self._init_renderer()
+        
+    def _init_renderer(self):
+        """Precalcular la geometría de las barras y los colores del render"""
+        # Colores en orden BGR (OpenCV); con canal alfa el fondo es transparente
+        if self.output_alpha:
+            self.background_bgr = np.array(tuple(self.background_color[::-1]) + (0,), dtype=np.uint8)
+            self.bar_bgr = np.array(tuple(self.bar_color[::-1]) + (255,), dtype=np.uint8)
+        else:
+            self.background_bgr = np.array(self.background_color[::-1], dtype=np.uint8)
+            self.bar_bgr = np.array(self.bar_color[::-1], dtype=np.uint8)
+        self.pipe_profile = 'visualization_alpha' if self.output_alpha else 'visualization'
+        if self.pipe_settings is None:
+            self.pipe_settings = dict(FRAME_PIPE_CONFIG[self.pipe_profile])
+        
+        # Región de salida: solo la franja donde pueden aparecer barras (incluye
+        # la fila base); el resto del frame sería siempre color de fondo. El
+        # margen de fondo deja que los filtros del chroma key vean el mismo
+        # entorno que en el frame completo (con canal alfa no hace falta)
+        if self.region_of_interest:
+            margin = 0 if self.output_alpha else self.chroma_margin
+            self.strip_top = max(self.region_bottom - self.max_bar_height - margin, 0)
+            strip_bottom = min(self.region_bottom + margin, self.height - 1)
+            self.strip_height = strip_bottom - self.strip_top + 1
+        else:
+            self.strip_top = 0
+            self.strip_height = self.height
+        self.strip_base = self.region_bottom - self.strip_top
+        # Fila superior de una barra vacía (justo debajo de la base, o el borde)
+        self.strip_empty = min(self.strip_base + 1, self.strip_height)
+        
+        # Columnas de cada barra (x0..x1 inclusive, igual que PIL)
+        self.bar_spans = []
+        for i in range(self.num_bars):
+            x0 = self.margin_x + i * (self.bar_width + self.gap)
+            x1 = min(x0 + self.bar_width, self.width - 1)
+            self.bar_spans.append((x0, x1 + 1))
+        
+        # Buffer de frame por hilo: main.py renderiza varias pistas en paralelo
+        # con la misma instancia
+        self._render_state = threading.local()
+        
+    def _new_render_state(self, frame_buffer, background=None):
+        """Estado de render sobre un buffer: vistas de cada barra y filas pintadas
+        
+        Con background (imagen del mismo tamaño que frame_buffer) las filas que
+        deja libre una barra se restauran desde la imagen en lugar de pintarse
+        con el color de fondo.
+        """
+        rows = slice(self.strip_top, self.strip_top + self.strip_height) if background is not None else slice(None)
+        state = SimpleNamespace(frame_buffer=frame_buffer)
+        state.bar_views = [frame_buffer[rows, x0:x1] for x0, x1 in self.bar_spans]
+        state.restore_views = [background[rows, x0:x1] if background is not None else None
+                               for x0, x1 in self.bar_spans]
+        state.bar_color = self.bar_bgr[:frame_buffer.shape[2]]
+        # Fila superior pintada actualmente en cada barra
+        state.drawn_tops = [self.strip_empty] * self.num_bars
+        return state
+    
+    def _get_render_state(self):
+        """Buffer de la franja reutilizable del hilo actual"""
+        local = self._render_state
+        if not hasattr(local, 'state'):
+            frame_buffer = np.empty((self.strip_height, self.width, len(self.background_bgr)), dtype=np.uint8)
+            frame_buffer[:] = self.background_bgr
+            local.state = self._new_render_state(frame_buffer)
+        return local.state
+    
+    def make_canvas_state(self, background):
+        """Estado de render que pinta las barras directamente sobre una copia de la imagen de fondo"""
+        return self._new_render_state(background.copy(), background)
+    
+    def get_worker_config(self):
+        """Configuración ya resuelta para los visualizadores de los workers
+        
+        Los workers 'spawn' vuelven a importar config.py: si solo recibieran
+        self.config (las opciones explícitas), cualquier cambio en memoria de
+        VISUALIZER_CONFIG haría que el proceso principal y los workers
+        calcularan distinta extensión, franja o clave de caché.
+        """
+        return {
+            'width': self.width,
+            'height': self.height,
+            'fps': self.fps,
+            'num_bars': self.num_bars,
+            'margin_x': self.margin_x,
+            'background_color': self.background_color,
+            'bar_color': self.bar_color,
+            'gap': self.gap,
+            'vertical_offset': self.vertical_offset,
+            'n_fft': self.n_fft,
+            'power': self.power,
+            'analysis_sample_rate': self.analysis_sample_rate,
+            'mel_backend': self.analysis_plans.backend,
+            'streaming_analysis': self.streaming_analysis,
+            'analysis_block_seconds': self.analysis_block_seconds,
+            'region_of_interest': self.region_of_interest,
+            'output_alpha': self.output_alpha,
+            'chroma_margin': self.chroma_margin,
+            'pipe_settings': dict(self.pipe_settings),
+            # La caché solo se modifica en el proceso principal
+            'feature_cache_enabled': False
+        }
+    
+    def get_output_size(self):
+        """Tamaño (ancho, alto) de los frames que produce el visualizador"""
+        return self.width, self.strip_height
+    
+    def get_output_extension(self):
+        """Extensión del contenedor de las visualizaciones según el perfil de códec"""
+        return self.pipe_settings['extension']
+    
+    def get_placement(self):
+        """Posición (x, y) de la salida del visualizador dentro del frame completo"""
+        return 0, self.strip_top
+    
+    def bar_tops(self, heights):
+        """Fila superior de cada barra dentro de la franja de salida"""
+        return np.clip(self.strip_base - heights, 0, self.strip_empty)
+        
+    def get_analysis_sample_rate(self, audio_path):
+        """Frecuencia a la que se analiza un archivo"""
+        if self.analysis_sample_rate:
+            # Con una frecuencia de análisis fija todas las pistas comparten plan
+            return self.analysis_sample_rate
+        info = get_audio_info(audio_path)
+        if not info or not info['sample_rate']:
+            raise RuntimeError(f"No se pudo leer la frecuencia de muestreo de {audio_path}")
+        return info['sample_rate']
+    
+    def load_audio(self, audio_path):
+        """Cargar archivo de audio (mono float32, decodificado con ffmpeg)"""
+        try:
+            sr = self.get_analysis_sample_rate(audio_path)
+            y = np.concatenate([np.zeros(0, dtype=np.float32), *self.iter_audio_blocks(audio_path, sr)])
+            logger.info(f"Audio cargado: {audio_path} (sr={sr}, duration={len(y)/sr:.2f}s)")
+            return y, sr
+        except Exception as e:
+            logger.error(f"Error al cargar audio {audio_path}: {e}")
+            return None, None
+    
+    def calculate_mel_spectrogram(self, y, sr):
+        """Calcular espectrograma de mel"""
+        try:
+            mel_spec = self.get_analysis_plan(sr).mel_spectrogram(y)
+            
+            # Normalizar cada banda al rango [0,1]
+            band_max = np.max(mel_spec, axis=1, keepdims=True)
+            band_max[band_max == 0] = 1e-6
+            mel_spec_norm = mel_spec / band_max
+            
+            logger.info(f"Espectrograma calculado: {mel_spec_norm.shape[1]} frames")
+            return mel_spec_norm
+            
+        except Exception as e:
+            logger.error(f"Error al calcular espectrograma: {e}")
+            return None
+    
+    def iter_audio_blocks(self, audio_path, sample_rate):
+        """Decodificar con ffmpeg a mono float32 y entregar bloques de tamaño acotado"""
+        block_samples = int(self.analysis_block_seconds * sample_rate)
+        return iter_pcm_blocks(audio_path, sample_rate, 1, block_samples, sample_format='f32le')
+    
+    def get_analysis_plan(self, sample_rate):
+        """Plan de análisis para una frecuencia de muestreo (creado una sola vez)"""
+        hop_length = int(sample_rate / self.fps)
+        return self.analysis_plans.get(sample_rate, self.n_fft, hop_length, self.num_bars, self.power)
+    
+    def iter_mel_blocks(self, audio_path, sample_rate):
+        """Espectrograma de mel por bloques, sin normalizar (bandas x frames)
+        
+        Equivale a librosa.feature.melspectrogram con center=True: se antepone
+        y se añade n_fft // 2 de silencio, y entre bloques se arrastran las
+        muestras que aún no completan un frame.
+        """
+        plan = self.get_analysis_plan(sample_rate)
+        
+        carry = plan.padding
+        for block in self.iter_audio_blocks(audio_path, sample_rate):
+            samples = np.concatenate([carry, block])
+            num_frames = plan.num_frames(len(samples))
+            if num_frames == 0:
+                carry = samples
+                continue
+            yield plan.frames_to_mel(samples)
+            carry = samples[num_frames * plan.hop_length:]
+        
+        samples = np.concatenate([carry, plan.padding])
+        if plan.num_frames(len(samples)):
+            yield plan.frames_to_mel(samples)
+    
+    def stream_mel_spectrogram(self, audio_path):
+        """Espectrograma de mel normalizado entregado por bloques (memoria acotada)
+        
+        Dos pasadas sobre el archivo: la primera solo guarda el máximo de cada
+        banda y la segunda entrega los bloques ya normalizados, con el mismo
+        resultado que calculate_mel_spectrogram sobre la pista completa.
+        """
+        sample_rate = self.get_analysis_sample_rate(audio_path)
+        
+        band_max = np.zeros((self.num_bars, 1), dtype=np.float32)
+        num_frames = 0
+        for mel_block in self.iter_mel_blocks(audio_path, sample_rate):
+            np.maximum(band_max, mel_block.max(axis=1, keepdims=True), out=band_max)
+            num_frames += mel_block.shape[1]
+        band_max[band_max == 0] = 1e-6
+        
+        logger.info(f"Espectrograma por bloques: {num_frames} frames (sr={sample_rate})")
+        return num_frames, (mel_block / band_max for mel_block in self.iter_mel_blocks(audio_path, sample_rate))
+    
+    def get_mel_spectrogram(self, audio_path):
+        """Espectrograma normalizado como (número de frames, bloques bandas x frames)"""
+        if self.streaming_analysis:
+            return self.stream_mel_spectrogram(audio_path)
+        
+        # Cargar audio
+        y, sr = self.load_audio(audio_path)
+        if y is None or sr is None:
+            raise RuntimeError(f"No se pudo cargar {audio_path}")
+        
+        # Calcular espectrograma
+        mel_spec_norm = self.calculate_mel_spectrogram(y, sr)
+        if mel_spec_norm is None:
+            raise RuntimeError(f"No se pudo calcular el espectrograma de {audio_path}")
+        return mel_spec_norm.shape[1], [mel_spec_norm]
+    
+    def get_feature_key(self, audio_path):
+        """Clave de caché: huella del audio más los parámetros del análisis"""
+        if self.library is None:
+            self.library = LibraryIndex()
+        fingerprint = self.library.get_fingerprint(audio_path)
+        if fingerprint is None:
+            return None
+        return DiskCache.make_key(FEATURE_VERSION, fingerprint, self.fps, self.n_fft, self.num_bars, self.power,
+                                  self.analysis_sample_rate)
+    
+    def compute_features(self, audio_path, output_path):
+        """Calcular el espectrograma normalizado y escribirlo como .npy float16
+        
+        Los bloques se copian directamente al archivo mapeado en memoria, así
+        que el análisis por streaming mantiene su memoria acotada.
+        """
+        num_frames, mel_blocks = self.get_mel_spectrogram(audio_path)
+        features = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float16,
+                                             shape=(self.num_bars, num_frames))
+        start = 0
+        for mel_block in mel_blocks:
+            features[:, start:start + mel_block.shape[1]] = mel_block
+            start += mel_block.shape[1]
+        features.flush()
+        del features
+        return num_frames
+    
+    def load_features(self, audio_path):
+        """Espectrograma normalizado (bandas x frames) mapeado en memoria desde la caché"""
+        with self.feature_lock:
+            key = self.get_feature_key(audio_path)
+            if key is None:
+                raise RuntimeError(f"No se pudo indexar {audio_path}")
+            self.active_feature_keys.add(key)
+            cached_path = self.feature_cache.lookup(key)
+        
+        if cached_path:
+            logger.info(f"Espectrograma en caché: {os.path.basename(audio_path)}")
+        else:
+            os.makedirs(TEMP_DIR, exist_ok=True)
+            temp_path = os.path.join(TEMP_DIR, f"features_{key}.npy")
+            try:
+                num_frames = self.compute_features(audio_path, temp_path)
+                with self.feature_lock:
+                    cached_path = self.feature_cache.store(key, temp_path, '.npy', {
+                        'source': os.path.basename(audio_path),
+                        'frames': num_frames
+                    })
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        
+        with self.feature_lock:
+            # No expulsar espectrogramas que otro hilo esté renderizando
+            self.feature_cache.evict(keep=self.active_feature_keys)
+            self.feature_cache.save()
+            self.library.save()
+        
+        return np.load(cached_path, mmap_mode='r')
+    
+    def bar_heights(self, mel_frames):
+        """Altura en píxeles de cada barra para uno o varios frames (bandas x frames)"""
+        return (np.asarray(mel_frames, dtype=np.float32) * self.max_bar_height).astype(np.int32)
+    
+    def _draw_tops(self, tops, state=None):
+        """Actualizar el buffer a partir de la fila superior de cada barra
+        
+        El buffer conserva el frame anterior, así que solo se repintan las filas
+        que cambian en cada barra: las que crecen con el color de barra y las
+        que bajan con el color (o la imagen) de fondo.
+        """
+        if state is None:
+            state = self._get_render_state()
+        for view, restore, top, drawn in zip(state.bar_views, state.restore_views, tops, state.drawn_tops):
+            if top < drawn:
+                view[top:drawn] = state.bar_color
+            elif top > drawn:
+                view[drawn:top] = self.background_bgr if restore is None else restore[drawn:top]
+        state.drawn_tops = tops
+        return state.frame_buffer
+    
+    def render_frames(self, mel_spec_norm, batch_size=256, state=None):
+        """Generar frames BGR a partir del espectrograma, por lotes
+        
+        Las filas superiores de todas las barras se calculan para un lote
+        completo con operaciones vectorizadas; cada frame se pinta sobre el
+        mismo buffer, que se entrega en cada iteración (no conservar referencias).
+        Con state (make_canvas_state) se pinta sobre ese buffer en su lugar.
+        """
+        num_frames = mel_spec_norm.shape[1]
+        for start in range(0, num_frames, batch_size):
+            heights = self.bar_heights(mel_spec_norm[:, start:start + batch_size])
+            # Frames x barras; la base (region_bottom) siempre se pinta, como en PIL
+            for tops in self.bar_tops(heights.T).tolist():
+                yield self._draw_tops(tops, state)
+    
+    def create_frame(self, magnitudes):
+        """Crear un frame individual del visualizador (frame completo)"""
+        try:
+            heights = self.bar_heights(magnitudes)
+            strip = self._draw_tops(self.bar_tops(heights).tolist())
+            
+            frame = np.empty((self.height, self.width, len(self.background_bgr)), dtype=np.uint8)
+            frame[:] = self.background_bgr
+            frame[self.strip_top:self.strip_top + self.strip_height] = strip
+            return frame
+            
+        except Exception as e:
+            logger.error(f"Error al crear frame: {e}")
+            return None
+    
+    def create_frame_pil(self, magnitudes):
+        """Implementación de referencia con PIL (validación y benchmark)"""
+        # Crear lienzo
+        img = Image.new("RGB", (self.width, self.height), self.background_color)
+        draw = ImageDraw.Draw(img)
+        
+        # Dibujar barras verticales
+        for i, mag in enumerate(magnitudes):
+            bar_height = int(mag * self.max_bar_height)
+            x0 = self.margin_x + i * (self.bar_width + self.gap)
+            x1 = x0 + self.bar_width
+            y1 = self.region_bottom
+            y0 = self.region_bottom - bar_height
+            draw.rectangle([(x0, y0), (x1, y1)], fill=self.bar_color)
+        
+        # Convertir PIL a BGR para OpenCV
+        return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    
+    def render_visualization(self, num_frames, mel_blocks, output_path, progress_callback=None):
+        """Renderizar y codificar los frames de un espectrograma normalizado
+        
+        progress_callback(frame, total), si se indica, se llama cada 100 frames.
+        """
+        # Crear directorio de salida si no existe
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        
+        # Enviar los frames sin comprimir a un único proceso ffmpeg
+        width, height = self.get_output_size()
+        video_writer = FFmpegFrameWriter(output_path, width, height, self.fps, profile=self.pipe_settings,
+                                         input_pix_fmt='bgra' if self.output_alpha else 'bgr24')
+        
+        # Generar frames
+        try:
+            frame_idx = 0
+            for mel_block in mel_blocks:
+                for frame in self.render_frames(mel_block):
+                    if frame_idx % 100 == 0:
+                        logger.info(f"Procesando frame {frame_idx}/{num_frames}")
+                        if progress_callback is not None:
+                            progress_callback(frame_idx, num_frames)
+                    
+                    video_writer.write(frame)
+                    frame_idx += 1
+        except Exception:
+            video_writer.abort()
+            raise
+        
+        # Finalizar y guardar video
+        if not video_writer.close():
+            return False
+        logger.info(f"Visualización guardada: {output_path}")
+        return True
+    
+    def render_playlist(self, background, playlist, durations, features):
+        """Frames completos de toda la lista con las barras pintadas sobre el fondo
+        
+        No se escribe ningún archivo intermedio: los frames salen del mismo
+        buffer (no conservar referencias). Cada pista ocupa exactamente los
+        frames que le corresponden en el audio combinado, recortando o
+        repitiendo su último frame, para que el video no se desfase.
+        
+        features asigna a cada pista la ruta .npy de su espectrograma, ya
+        calculado (make_render_job + analyze_job); las pistas sin espectrograma
+        (None) ocupan su tramo solo con el fondo.
+        """
+        state = self.make_canvas_state(background)
+        emitted = 0
+        elapsed = 0.0
+        for audio_path, duration in zip(playlist, durations):
+            elapsed += duration
+            target = int(round(elapsed * self.fps)) - emitted
+            emitted += target
+            
+            features_path = features.get(audio_path)
+            if features_path is None:
+                for _ in range(target):
+                    yield background
+                continue
+            
+            count = 0
+            mel_spec_norm = np.load(features_path, mmap_mode='r')
+            for frame in self.render_frames(mel_spec_norm[:, :target], state=state):
+                yield frame
+                count += 1
+            
+            while count < target:
+                yield state.frame_buffer
+                count += 1
+    
+    def generate_visualization(self, audio_path, output_path):
+        """Generar visualización completa para un archivo de audio"""
+        try:
+            logger.info(f"Generando visualización: {audio_path} -> {output_path}")
+            
+            if self.feature_cache_enabled:
+                mel_spec_norm = self.load_features(audio_path)
+                num_frames, mel_blocks = mel_spec_norm.shape[1], [mel_spec_norm]
+            else:
+                num_frames, mel_blocks = self.get_mel_spectrogram(audio_path)
+            
+            return self.render_visualization(num_frames, mel_blocks, output_path)
+            
+        except Exception as e:
+            logger.error(f"Error al generar visualización: {e}")
+            return False
+    
+    def make_render_job(self, index, audio_path, output_path):
+        """Descriptor serializable de una visualización para el pool de procesos
+        
+        La caché de espectrogramas se consulta aquí, en el proceso principal: si
+        falta la entrada, un worker la calcula con analyze_job en
+        "features_output" y el proceso principal la registra con store_job_features.
+        """
+        job = {
+            'index': index,
+            'audio_path': audio_path,
+            'output_path': output_path,
+            'features_path': None,
+            'features_output': None,
+            'feature_key': None
+        }
+        if self.feature_cache_enabled:
+            with self.feature_lock:
+                key = self.get_feature_key(audio_path)
+                if key is not None:
+                    self.active_feature_keys.add(key)
+                    job['feature_key'] = key
+                    job['features_path'] = self.feature_cache.lookup(key)
+        
+        if job['features_path'] is None:
+            # Sin caché el espectrograma vive en temporales hasta terminar el render
+            name = job['feature_key'] or f"{os.getpid()}_{index:03d}"
+            job['features_output'] = os.path.join(TEMP_DIR, f"features_{name}.npy")
+            os.makedirs(TEMP_DIR, exist_ok=True)
+        return job
+    
+    def store_job_features(self, job, result):
+        """Registrar el espectrograma calculado por un worker (en la caché si está activa)"""
+        features_output = job['features_output']
+        if not features_output or not os.path.exists(features_output):
+            return
+        
+        if not result.get('success'):
+            os.remove(features_output)
+            return
+        
+        if job['feature_key'] is None:
+            job['features_path'] = features_output
+            return
+        
+        with self.feature_lock:
+            job['features_path'] = self.feature_cache.store(job['feature_key'], features_output, '.npy', {
+                'source': os.path.basename(job['audio_path']),
+                'frames': result['frames']
+            })
+            job['features_output'] = None
+            self.feature_cache.evict(keep=self.active_feature_keys)
+            self.feature_cache.save()
+            self.library.save()
+    
+    def split_render_job(self, job, num_frames, shard_frames):
+        """Dividir el render de una pista en fragmentos de tiempo independientes
+        
+        Cada fragmento se codifica por separado (empieza con un fotograma clave
+        y GOP cerrado), así que join_shards puede unirlos copiando el stream.
+        """
+        num_shards = max(1, -(-num_frames // max(shard_frames, 1)))
+        if num_shards == 1:
+            return [dict(job, frame_start=0, frame_end=num_frames)]
+        
+        base, extension = os.path.splitext(job['output_path'])
+        return [
+            dict(job, frame_start=start, frame_end=min(start + shard_frames, num_frames),
+                 output_path=f"{base}.part{shard:03d}{extension}")
+            for shard, start in enumerate(range(0, num_frames, shard_frames))
+        ]
+    
+    def join_shards(self, shard_paths, output_path):
+        """Unir fragmentos con el concat demuxer de ffmpeg, sin recodificar"""
+        if len(shard_paths) == 1:
+            if shard_paths[0] != output_path:
+                os.replace(shard_paths[0], output_path)
+            return True
+        
+        list_path = os.path.splitext(output_path)[0] + '.concat.txt'
+        try:
+            with open(list_path, 'w', encoding='utf-8') as f:
+                for path in shard_paths:
+                    escaped = os.path.abspath(path).replace("'", "'\\''")
+                    f.write(f"file '{escaped}'\n")
+            
+            cmd = [
+                'ffmpeg', '-y', '-v', 'error',
+                '-f', 'concat', '-safe', '0',
+                '-i', list_path,
+                '-c', 'copy',
+                output_path
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                logger.error(f"Error al unir fragmentos de {output_path}: {result.stderr}")
+                return False
+            return True
+        
+        finally:
+            for path in shard_paths + [list_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    def generate_batch_visualizations(self, audio_files, output_dir):
+        """Generar visualizaciones para múltiples archivos de audio"""
+        results = []
+        
+        for i, audio_file in enumerate(audio_files):
+            try:
+                # Crear nombre de archivo de salida
+                base_name = os.path.splitext(os.path.basename(audio_file))[0]
+                output_file = os.path.join(output_dir, f"viz_{i:03d}_{base_name}{self.get_output_extension()}")
+                
+                # Generar visualización
+                success = self.generate_visualization(audio_file, output_file)
+                results.append((audio_file, output_file, success))
+                
+            except Exception as e:
+                logger.error(f"Error en procesamiento por lotes para {audio_file}: {e}")
+                results.append((audio_file, None, False))
+        
+        return results
+
+# Visualizador de cada proceso del pool (se crea una vez por worker)
+_worker_visualizer = None
+_worker_progress = None
+
+def init_render_worker(config, progress_queue=None):
+    """Inicializador del pool: un visualizador por proceso, sin caché propia
+    
+    config debe ser AudioVisualizer.get_worker_config() del proceso principal.
+    """
+    global _worker_visualizer, _worker_progress
+    # El progreso se informa al proceso principal por la cola
+    logger.setLevel(logging.WARNING)
+    _worker_visualizer = AudioVisualizer(dict(config, feature_cache_enabled=False))
+    _worker_progress = progress_queue
+
+def analyze_job(job):
+    """Calcular en un worker el espectrograma de un trabajo sin entrada en caché"""
+    start = time.perf_counter()
+    result = {'index': job['index'], 'success': False, 'frames': 0, 'error': None}
+    try:
+        result['frames'] = _worker_visualizer.compute_features(job['audio_path'], job['features_output'])
+        result['success'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def render_job(job):
+    """Renderizar en un worker el rango de frames de un trabajo (o fragmento)"""
+    start = time.perf_counter()
+    result = {'index': job['index'], 'success': False, 'frames': 0, 'error': None}
+    
+    def report(frame, total):
+        if _worker_progress is not None:
+            _worker_progress.put((job['output_path'], frame, total))
+    
+    try:
+        mel_spec_norm = np.load(job['features_path'], mmap_mode='r')
+        mel_block = mel_spec_norm[:, job['frame_start']:job['frame_end']]
+        
+        result['frames'] = mel_block.shape[1]
+        result['success'] = _worker_visualizer.render_visualization(
+            result['frames'], [mel_block], job['output_path'], progress_callback=report
+        )
+        report(result['frames'], result['frames'])
+    except Exception as e:
+        result['error'] = str(e)
+    
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def benchmark_renderer(num_frames=300, config=None):
+    """Comparar el render vectorizado con la implementación PIL de referencia"""
+    visualizer = AudioVisualizer(config)
+    rng = np.random.default_rng(0)
+    mel_spec = rng.random((visualizer.num_bars, num_frames), dtype=np.float32)
+    
+    start = time.perf_counter()
+    for frame_idx in range(num_frames):
+        visualizer.create_frame_pil(mel_spec[:, frame_idx])
+    pil_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for frame in visualizer.render_frames(mel_spec):
+        pass
+    numpy_time = time.perf_counter() - start
+    
+    # Verificar que ambos caminos producen exactamente el mismo frame (color, sin alfa)
+    identical = np.array_equal(visualizer.create_frame_pil(mel_spec[:, -1]), visualizer.create_frame(mel_spec[:, -1])[..., :3])
+    
+    return {
+        'frames': num_frames,
+        'pil_fps': num_frames / pil_time,
+        'numpy_fps': num_frames / numpy_time,
+        'speedup': pil_time / numpy_time,
+        'identical': identical
+    }
+
+# Mantener compatibilidad con el script original
+if __name__ == "__main__":
+    import sys
+    
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        num_frames = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+        result = benchmark_renderer(num_frames)
+        print(f"Frames: {result['frames']}")
+        print(f"PIL (antes):     {result['pil_fps']:.1f} frames/s")
+        print(f"NumPy (después): {result['numpy_fps']:.1f} frames/s")
+        print(f"Aceleración: x{result['speedup']:.1f} (frames idénticos: {result['identical']})")
+        sys.exit(0)
+    
+    visualizer = AudioVisualizer()
+    
+    # El contenedor lo fija el perfil de códec (FFV1 con alfa solo cabe en .mkv)
+    extension = visualizer.get_output_extension()
+    
+    # Configuración por defecto para compatibilidad
+    default_config = {
+        'audio_path': sys.argv[1] if len(sys.argv) > 1 else "output_20250706195359_0.mp3",
+        'output_path': sys.argv[2] if len(sys.argv) > 2 else f"audio_visualization_vertical{extension}"
+    }
+    
+    base, requested_extension = os.path.splitext(default_config['output_path'])
+    if requested_extension.lower() != extension:
+        default_config['output_path'] = base + extension
+        print(f"El perfil de video actual escribe {extension}: "
+              f"se guardará en '{default_config['output_path']}'")
+    
+    # Verificar si el archivo de audio existe
+    if os.path.exists(default_config['audio_path']):
+        success = visualizer.generate_visualization(
+            default_config['audio_path'], 
+            os.path.abspath(default_config['output_path'])
+        )
+        if success:
+            print(f"Video guardado en '{default_config['output_path']}'")
+        else:
+            print("Error al generar la visualización")
+    else:
+        print(f"Archivo de audio no encontrado: {default_config['audio_path']}")
+        print(f"Usa: python visualizer_transparent.py <audio_file> <output_file{extension}>")
+        print("     python visualizer_transparent.py --benchmark [frames]")